@@ -4,14 +4,18 @@
 import sys
 import datetime
 import json
-import dateutil.parser
-import babel
+from datetime import timedelta
+from functools import wraps
+from itertools import groupby
 from flask import (
   Flask,
+  abort,
   render_template,
+  stream_with_context,
   request,
   Response,
   flash,
+  jsonify,
   redirect,
   url_for
 )
@@ -22,7 +26,21 @@ from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from models import db, Artist, Venue, Show
-from sqlalchemy import or_
+from assets import assets
+import batch
+import bulk
+from cache import cached, response_cache, tag
+import counters
+import matchmaking
+import partitions
+from formatting import format_datetime, with_datetimes
+import schedule
+from instrumentation import sql_instrumentation
+from negotiation import respond, wants_json
+from pagination import InvalidCursor, paginate, paginate_stream
+from routing import replica_reads
+from sqlalchemy import func, or_, select, union_all
+from sqlalchemy.orm import aliased
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -31,22 +49,199 @@ app = Flask(__name__)
 app.config.from_object('config')
 moment = Moment(app)
 db.init_app(app)
+response_cache.init_app(app)
+assets.init_app(app)
+sql_instrumentation.init_app(app)
 migrate = Migrate(app, db)
+app.cli.add_command(counters.counters_cli)
+app.cli.add_command(bulk.data_cli)
+app.cli.add_command(partitions.shows_cli)
+app.cli.add_command(matchmaking.matchmaking_cli)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(str(value))
-  # ensure value is parsed correctly in case it is already a datetime object
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
-
 app.jinja_env.filters['datetime'] = format_datetime
+app.jinja_env.filters['with_datetimes'] = with_datetimes
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def search_params():
+  """Return the search term, results page and page size of a search."""
+  search_term = request.values.get('search_term', '').strip()
+  page = max(request.values.get('page', 1, type=int), 1)
+  return search_term, page, app.config['SEARCH_RESULTS_PER_PAGE']
+
+def load_with_shows(model, entity_id, key, other_model, other_key):
+  """Load a venue or artist and its shows in one statement.
+
+  key is the Show column pointing at model (Show.venue_id for a venue)
+  and other_key the one pointing at other_model. Returns None if there
+  is no such row, else (entity, past shows, upcoming shows), where each
+  show is a (Show, other party) pair in start_time order.
+
+  The shows come from a UNION ALL of two halves split at one timestamp:
+  the upcoming shows, bounded below by now so Postgres prunes them to
+  the current and later partitions, and the DETAIL_PAST_SHOWS most
+  recent past shows, read backwards through the start_time index so only
+  as many past months are scanned as that needs.
+  """
+  now = datetime.now()
+  shows = Show.__table__
+  upcoming = select([shows]).where(key == entity_id).where(
+    Show.start_time > now
+  )
+  past = select([shows]).where(key == entity_id).where(
+    Show.start_time <= now
+  ).order_by(Show.start_time.desc()).limit(app.config['DETAIL_PAST_SHOWS'])
+  party_show = aliased(Show, union_all(upcoming, past.alias().select()).alias())
+  rows = db.session.query(model, party_show, other_model).outerjoin(
+    party_show, getattr(party_show, key.key) == model.id
+  ).outerjoin(
+    other_model, other_model.id == getattr(party_show, other_key.key)
+  ).filter(model.id == entity_id).order_by(party_show.start_time).all()
+  if not rows:
+    return None
+
+  past_shows, upcoming_shows = [], []
+  for _, show, other in rows:
+    if show is not None:
+      (upcoming_shows if show.start_time > now else past_shows).append(
+        (show, other)
+      )
+  return rows[0][0], past_shows, upcoming_shows
+
+def past_shows_count(entity, upcoming_shows):
+  """Count all past shows of entity, of which only the latest are loaded.
+
+  Writes keep the sum of the two show counters exact, while shows move
+  from upcoming to past only when the counters roll over.
+  """
+  return (
+    entity.upcoming_shows_count + entity.past_shows_count - len(upcoming_shows)
+  )
+
+def listing_page(query, keys, stream=False):
+  """Return the page of a listing selected by the after/before cursors."""
+  try:
+    return (paginate_stream if stream else paginate)(
+      query,
+      keys,
+      after=request.args.get('after'),
+      before=request.args.get('before'),
+      per_page=app.config['LISTING_PAGE_SIZE'],
+    )
+  except InvalidCursor:
+    abort(400)
+
+def listing_payload(data, page):
+  """Return the JSON body of a listing page: its rows and cursors."""
+  return {
+    "data": data,
+    "next_cursor": page.next_cursor,
+    "prev_cursor": page.prev_cursor,
+  }
+
+@app.template_global()
+def page_url(**cursor):
+  """Return the current URL with its page cursor replaced by cursor."""
+  args = request.args.to_dict(flat=False)
+  args.pop('after', None)
+  args.pop('before', None)
+  args.update(cursor)
+  return url_for(request.endpoint, **dict(request.view_args, **args))
+
+def browse_filters():
+  """Return the genre/state/seeking filters of a browse request."""
+  filters = {
+    "genres": request.args.getlist('genre'),
+    "state": request.args.get('state') or None,
+    "seeking": bool(request.args.get('seeking')),
+  }
+  if (any(genre not in dict(genre_choices) for genre in filters["genres"])
+      or (filters["state"] and filters["state"] not in dict(state_choices))):
+    abort(400)
+  return filters
+
+def browse(model, seeking_column, filters):
+  """Return a page of model rows matching filters.
+
+  Genres are matched by array containment so the GIN index on the
+  genres column serves the filter.
+  """
+  query = db.session.query(
+    model.id,
+    model.name,
+    model.city,
+    model.state,
+    model.genres,
+    model.upcoming_shows_count,
+  )
+  if filters["genres"]:
+    query = query.filter(model.genres.contains(filters["genres"]))
+  if filters["state"]:
+    query = query.filter(model.state == filters["state"])
+  if filters["seeking"]:
+    query = query.filter(seeking_column.is_(True))
+  return listing_page(query, [model.id])
+
+def browse_results(page):
+  """Build the template data for a page of browse() rows."""
+  return [
+    {
+      "id": row.id,
+      "name": row.name,
+      "city": row.city,
+      "state": row.state,
+      "genres": row.genres,
+      "num_upcoming_shows": row.upcoming_shows_count,
+    }
+    for row in page
+  ]
+
+def calendar(kind, model, entity_id):
+  """Return a venue's or artist's shows for a month or the next N shows.
+
+  ``?month=YYYY-MM`` selects a month view; otherwise ``?next=N`` (default
+  10) lists the next shows from now.
+  """
+  if db.session.query(model.id).filter(model.id == entity_id).scalar() is None:
+    abort(404)
+  if request.args.get('month'):
+    try:
+      start, end = schedule.month_range(request.args['month'])
+    except ValueError:
+      abort(400)
+    shows = schedule.shows_between(kind, entity_id, start, end)
+  else:
+    limit = request.args.get('next', 10, type=int)
+    if not 0 < limit <= app.config['CALENDAR_MAX_SHOWS']:
+      abort(400)
+    shows = schedule.next_shows(kind, entity_id, datetime.now(), limit)
+
+  other = 'artist' if kind == 'venue' else 'venue'
+  tag('{}:{}'.format(kind, entity_id))
+  tag(*[
+    '{}:{}'.format(other, getattr(show, other + '_id')) for show in shows
+  ])
+  return jsonify({
+    kind + "_id": entity_id,
+    "shows": [
+      dict(show._asdict(), start_time=show.start_time.isoformat())
+      for show in shows
+    ],
+  })
+
+def stream_template(template_name, **context):
+  """Render a template in chunks, yielding output as rows are fetched."""
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  stream = template.stream(context)
+  stream.enable_buffering(app.config['TEMPLATE_STREAM_BUFFER'])
+  return stream
 
 #----------------------------------------------------------------------------#
 # Controllers.
@@ -61,68 +256,115 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cached('venues')
 def venues():
   """Show a list of existing venues."""
-  venues = Venue.query.all()
-  cities = Venue.query.distinct('city', 'state').all()
-
-  data = []
-  for city in cities:
-    data.append({
-      "city": city.city,
-      "state": city.state,
+  counters.maybe_roll_over()
+  page = listing_page(
+    db.session.query(
+      Venue.id,
+      Venue.name,
+      Venue.city,
+      Venue.state,
+      Venue.upcoming_shows_count,
+    ),
+    [Venue.city, Venue.state, Venue.id],
+  )
+
+  # Rows arrive sorted by area, so each city/state group is contiguous.
+  data = [
+    {
+      "city": city,
+      "state": state,
       "venues": [
         {
-          "id": venue.id,
-          "name": venue.name,
-          "num_upcoming_shows": len(
-            [show for show in venue.shows if show.start_time > datetime.now()]
-          )
+          "id": row.id,
+          "name": row.name,
+          "num_upcoming_shows": row.upcoming_shows_count,
         }
-        for venue in venues if venue.city == city.city \
-          and venue.state == city.state
+        for row in area_rows
       ]
-    })
+    }
+    for (city, state), area_rows in groupby(
+      page, key=lambda row: (row.city, row.state)
+    )
+  ]
 
-  return render_template('pages/venues.html', areas=data);
+  return respond(
+    'pages/venues.html', listing_payload(data, page), areas=data, page=page
+  )
 
-@app.route('/venues/search', methods=['POST'])
+@app.route('/venues/browse')
+@cached('venues')
+def browse_venues():
+  """Browse venues by genre and state, e.g. Jazz venues in CA."""
+  filters = browse_filters()
+  page = browse(Venue, Venue.seeking_talent, filters)
+  results = browse_results(page)
+  return respond(
+    'pages/browse.html',
+    listing_payload(results, page),
+    kind='venues',
+    icon='fa-music',
+    seeking_label='Seeking talent',
+    results=results,
+    page=page,
+    filters=filters,
+    genre_choices=genre_choices,
+    state_choices=state_choices,
+  )
+
+@app.route('/venues/search', methods=['GET', 'POST'])
+@replica_reads
 def search_venues():
   """Search for a venue."""
-  search_term = "%{}%".format(request.form["search_term"])
-  venues = Venue.query.filter(Venue.name.ilike(search_term)).all()
+  counters.maybe_roll_over()
+  search_term, page, per_page = search_params()
+  matches = Venue.query.filter(
+    Venue.name.ilike("%{}%".format(search_term))
+  )
+  venues = matches.order_by(
+    func.similarity(Venue.name, search_term).desc(), Venue.id
+  ).limit(per_page).offset((page - 1) * per_page).all()
   response = {
-    "count": len(venues),
+    "count": matches.count(),
+    "page": page,
+    "per_page": per_page,
     "data": [
       {
         "id": venue.id,
         "name": venue.name,
-        "num_upcoming_shows": len([show for show in venue.shows if \
-        show.start_time > datetime.now()])
+        "num_upcoming_shows": venue.upcoming_shows_count,
       }
       for venue in venues
     ]
   }
-  return render_template(
+  return respond(
     'pages/search_venues.html',
+    response,
     results=response,
-    search_term=request.form.get('search_term', '')
+    search_term=search_term
   )
 
 @app.route('/venues/<int:venue_id>')
+@cached()
 def show_venue(venue_id):
   """Show the details for a specific venue."""
-  venue = Venue.query.get(venue_id)
-  past_shows = Show.query.join(Venue).join(Artist).filter(
-    Show.venue_id == venue_id,
-    Show.artist_id == Artist.id,
-    Show.start_time < datetime.now(),
-  ).all()
-  upcoming_shows = Show.query.join(Venue).join(Artist).filter(
-    Show.venue_id == venue_id,
-    Show.artist_id == Artist.id,
-    Show.start_time > datetime.now(),
-  ).all()
+  loaded = load_with_shows(
+    Venue, venue_id, Show.venue_id, Artist, Show.artist_id
+  )
+  if loaded is None:
+    abort(404)
+  venue, past_shows, upcoming_shows = loaded
+  suggested_artists = matchmaking.suggestions(
+    'artist', venue.state, venue.city, venue.genres,
+    app.config['SUGGESTIONS_PER_PAGE']
+  )
+  tag('venue:{}'.format(venue.id))
+  tag(*['artist:{}'.format(show.artist_id)
+        for show, _ in past_shows + upcoming_shows])
+  tag('suggested-artists:{}'.format(venue.state))
+  tag(*['artist:{}'.format(artist.id) for artist in suggested_artists])
   data = {
     "id": venue.id,
     "name": venue.name,
@@ -138,31 +380,43 @@ def show_venue(venue_id):
     "image_link": venue.image_link,
     "past_shows": [
       {
-        "artist_id": show.artist.id,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
+        "artist_id": artist.id,
+        "artist_name": artist.name,
+        "artist_image_link": artist.image_link,
         "start_time": show.start_time
       }
-      for show in past_shows
+      for show, artist in past_shows
     ],
     "upcoming_shows": [
       {
-        "artist_id": show.artist.id,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
+        "artist_id": artist.id,
+        "artist_name": artist.name,
+        "artist_image_link": artist.image_link,
         "start_time": show.start_time
       }
-      for show in upcoming_shows
+      for show, artist in upcoming_shows
+    ],
+    "past_shows_count": past_shows_count(venue, upcoming_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+    "suggested_artists": [
+      {
+        "artist_id": artist.id,
+        "artist_name": artist.name,
+        "artist_image_link": artist.image_link,
+        "city": artist.city,
+        "shared_genres": artist.shared,
+      }
+      for artist in suggested_artists
     ],
-    "past_shows_count": len(
-      [show for show in venue.shows if show.start_time < datetime.now()]
-    ),
-    "upcoming_shows_count": len(
-      [show for show in venue.shows if show.start_time > datetime.now()]
-    ),
   }
 
-  return render_template('pages/show_venue.html', venue=data)
+  return respond('pages/show_venue.html', data, venue=data)
+
+@app.route('/venues/<int:venue_id>/calendar')
+@cached()
+def venue_calendar(venue_id):
+  """List a venue's shows by month or the next N upcoming, as JSON."""
+  return calendar('venue', Venue, venue_id)
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -181,7 +435,12 @@ def create_venue_submission():
     new_venue = Venue()
     form.populate_obj(new_venue)
     db.session.add(new_venue)
+    db.session.flush()
+    matchmaking.reindex('venue', [new_venue.id])
     db.session.commit()
+    response_cache.invalidate(
+      'venues', 'suggested-venues:{}'.format(form.state.data)
+    )
   except:
     db.session.rollback()
     print(sys.exc_info())
@@ -203,8 +462,20 @@ def delete_venue(venue_id):
   error = False
   try:
     venue = Venue.query.get(venue_id)
+    name = venue.name
+    # The pages of the artists who played here list its shows.
+    artist_ids = [artist_id for artist_id, in db.session.query(
+      Show.artist_id
+    ).filter(Show.venue_id == venue_id).distinct()]
+    counters.forget_venue_shows(venue_id)
     db.session.delete(venue)
+    matchmaking.reindex('venue', [venue_id])
     db.session.commit()
+    response_cache.invalidate(
+      'venues', 'artists', 'shows', 'venue:{}'.format(venue_id),
+      'suggested-venues:{}'.format(venue.state),
+      *['artist:{}'.format(artist_id) for artist_id in artist_ids]
+    )
   except:
     db.session.rollback()
     error = True
@@ -212,63 +483,103 @@ def delete_venue(venue_id):
     db.session.close()
 
   if error:
-    flash('An error occurred. Venue ' + venue.name + ' could not be deleted.')
+    flash('An error occurred. Venue ' + name + ' could not be deleted.')
   else:
-    flash('Venue ' + venue.name + ' was successfully deleted!')
+    flash('Venue ' + name + ' was successfully deleted!')
   return render_template('pages/home.html')
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@cached('artists')
 def artists():
   """Show all artists on Fyur."""
-  artists = Artist.query.all()
+  page = listing_page(
+    db.session.query(Artist.id, Artist.name), [Artist.id]
+  )
   data=[
     {
       "id": artist.id,
       "name": artist.name,
     }
-    for artist in artists
+    for artist in page
   ]
-  return render_template('pages/artists.html', artists=data)
+  return respond(
+    'pages/artists.html', listing_payload(data, page), artists=data,
+    page=page
+  )
+
+@app.route('/artists/browse')
+@cached('artists')
+def browse_artists():
+  """Browse artists by genre and state, e.g. Punk artists seeking venues."""
+  filters = browse_filters()
+  page = browse(Artist, Artist.seeking_venue, filters)
+  results = browse_results(page)
+  return respond(
+    'pages/browse.html',
+    listing_payload(results, page),
+    kind='artists',
+    icon='fa-users',
+    seeking_label='Seeking venues',
+    results=results,
+    page=page,
+    filters=filters,
+    genre_choices=genre_choices,
+    state_choices=state_choices,
+  )
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
+@replica_reads
 def search_artists():
   """Search for an artist."""
-  search_term = "%{}%".format(request.form["search_term"])
-  artists = Artist.query.filter(Artist.name.ilike(search_term)).all()
+  counters.maybe_roll_over()
+  search_term, page, per_page = search_params()
+  matches = Artist.query.filter(
+    Artist.name.ilike("%{}%".format(search_term))
+  )
+  artists = matches.order_by(
+    func.similarity(Artist.name, search_term).desc(), Artist.id
+  ).limit(per_page).offset((page - 1) * per_page).all()
   response = {
-    "count": len(artists),
+    "count": matches.count(),
+    "page": page,
+    "per_page": per_page,
     "data": [
       {
         "id": artist.id,
         "name": artist.name,
-        "num_upcoming_shows": len([show for show in artist.shows \
-           if show.start_time > datetime.now()])
+        "num_upcoming_shows": artist.upcoming_shows_count,
       }
       for artist in artists
     ]
   }
-  return render_template(
+  return respond(
     'pages/search_artists.html',
+    response,
     results=response,
-    search_term=request.form.get('search_term', '')
+    search_term=search_term
   )
 
 @app.route('/artists/<int:artist_id>')
+@cached()
 def show_artist(artist_id):
   """Show details for a specific artist"""
-  artist = Artist.query.get(artist_id)
-  past_shows = Show.query.join(Artist).join(Venue).filter(
-    Show.artist_id == artist_id,
-    Show.venue_id == Venue.id,
-    Show.start_time < datetime.now(),
-  ).all()
-  upcoming_shows = Show.query.join(Artist).join(Venue).filter(
-    Show.artist_id == artist_id,
-    Show.venue_id == Venue.id,
-    Show.start_time > datetime.now(),
-  ).all()
+  loaded = load_with_shows(
+    Artist, artist_id, Show.artist_id, Venue, Show.venue_id
+  )
+  if loaded is None:
+    abort(404)
+  artist, past_shows, upcoming_shows = loaded
+  suggested_venues = matchmaking.suggestions(
+    'venue', artist.state, artist.city, artist.genres,
+    app.config['SUGGESTIONS_PER_PAGE']
+  )
+  tag('artist:{}'.format(artist.id))
+  tag(*['venue:{}'.format(show.venue_id)
+        for show, _ in past_shows + upcoming_shows])
+  tag('suggested-venues:{}'.format(artist.state))
+  tag(*['venue:{}'.format(venue.id) for venue in suggested_venues])
 
   data = {
     "id": artist.id,
@@ -285,27 +596,41 @@ def show_artist(artist_id):
     "past_shows": [
       {
         "venue_id": show.venue_id,
-        "venue_name": show.venue.name,
-        "venue_image_link": show.venue.image_link,
+        "venue_name": venue.name,
+        "venue_image_link": venue.image_link,
         "start_time": show.start_time
       }
-      for show in past_shows
+      for show, venue in past_shows
     ],
     "upcoming_shows": [
       {
         "venue_id": show.venue_id,
-        "venue_name": show.venue.name,
-        "venue_image_link": show.venue.image_link,
+        "venue_name": venue.name,
+        "venue_image_link": venue.image_link,
         "start_time": show.start_time
       }
-      for show in upcoming_shows
+      for show, venue in upcoming_shows
+    ],
+    "past_shows_count": past_shows_count(artist, upcoming_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+    "suggested_venues": [
+      {
+        "venue_id": venue.id,
+        "venue_name": venue.name,
+        "venue_image_link": venue.image_link,
+        "city": venue.city,
+        "shared_genres": venue.shared,
+      }
+      for venue in suggested_venues
     ],
-    "past_shows_count": len([show for show in artist.shows \
-      if show.start_time < datetime.now()]),
-    "upcoming_shows_count": len([show for show in artist.shows \
-      if show.start_time > datetime.now()]),
   }
-  return render_template('pages/show_artist.html', artist=data)
+  return respond('pages/show_artist.html', data, artist=data)
+
+@app.route('/artists/<int:artist_id>/calendar')
+@cached()
+def artist_calendar(artist_id):
+  """List an artist's shows by month or the next N upcoming, as JSON."""
+  return calendar('artist', Artist, artist_id)
 
 #  Update
 #  ----------------------------------------------------------------
@@ -333,8 +658,15 @@ def edit_artist_submission(artist_id):
   form = ArtistForm(request.form)
   artist = Artist.query.get(artist_id)
   try:
+    old_state = artist.state
     form.populate_obj(artist)
+    matchmaking.reindex('artist', [artist_id])
     db.session.commit()
+    response_cache.invalidate(
+      'artists', 'shows', 'artist:{}'.format(artist_id),
+      'suggested-artists:{}'.format(old_state),
+      'suggested-artists:{}'.format(form.state.data)
+    )
   except:
     db.session.rollback()
     error = True
@@ -377,8 +709,15 @@ def edit_venue_submission(venue_id):
   form = VenueForm(request.form)
   venue = Venue.query.get(venue_id)
   try:
+    old_state = venue.state
     form.populate_obj(venue)
+    matchmaking.reindex('venue', [venue_id])
     db.session.commit()
+    response_cache.invalidate(
+      'venues', 'shows', 'venue:{}'.format(venue_id),
+      'suggested-venues:{}'.format(old_state),
+      'suggested-venues:{}'.format(form.state.data)
+    )
   except:
     db.session.rollback()
     error = True
@@ -413,7 +752,12 @@ def create_artist_submission():
     new_artist = Artist()
     form.populate_obj(new_artist)
     db.session.add(new_artist)
+    db.session.flush()
+    matchmaking.reindex('artist', [new_artist.id])
     db.session.commit()
+    response_cache.invalidate(
+      'artists', 'suggested-artists:{}'.format(form.state.data)
+    )
   except:
     db.session.rollback()
     error = True
@@ -433,22 +777,33 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@cached('shows')
 def shows():
-  """List past and upcoming shows."""
-  shows = Show.query.all()
-  data = [
-    {
-    "venue_id": show.venue_id,
-    "venue_name": show.venue.name,
-    "artist_id": show.artist.name,
-    "artist_name": show.artist.name,
-    "artist_image_link": show.artist.image_link,
-    "start_time": show.start_time,
-    }
-    for show in shows
-  ]
+  """List past and upcoming shows, streaming them as they are fetched."""
+  query = db.session.query(
+    Show.id,
+    Show.start_time,
+    Show.venue_id,
+    Venue.name.label('venue_name'),
+    Show.artist_id,
+    Artist.name.label('artist_name'),
+    Artist.image_link.label('artist_image_link'),
+  ).join(Venue, Show.venue_id == Venue.id).join(
+    Artist, Show.artist_id == Artist.id
+  )
+  keys = [Show.start_time, Show.id]
+  if wants_json():
+    page = listing_page(query, keys)
+    data = [row._asdict() for row in page]
+    return respond(
+      'pages/shows.html', listing_payload(data, page), shows=page, page=page
+    )
 
-  return render_template('pages/shows.html', shows=data)
+  # The HTML page is streamed, so it is sent before an ETag could be known.
+  page = listing_page(query, keys, stream=True)
+  return Response(stream_with_context(
+    stream_template('pages/shows.html', shows=page, page=page)
+  ))
 
 @app.route('/shows/create')
 def create_shows():
@@ -460,12 +815,31 @@ def create_shows():
 def create_show_submission():
   """Add a new show for a specific venue and artist."""
   error = False
+  clash_time = None
   form = ShowForm(request.form)
   try:
     new_show = Show()
     form.populate_obj(new_show)
-    db.session.add(new_show)
-    db.session.commit()
+    clash = schedule.booking_conflict(
+      new_show.venue_id,
+      new_show.artist_id,
+      new_show.start_time,
+      timedelta(hours=app.config['SHOW_SLOT_HOURS']),
+    )
+    if clash is not None:
+      clash_time = clash.start_time
+      db.session.rollback()
+    else:
+      db.session.add(new_show)
+      counters.record_show_created(new_show)
+      db.session.commit()
+      response_cache.invalidate(
+        'shows',
+        'venues',
+        'artists',
+        'venue:{}'.format(form.venue_id.data),
+        'artist:{}'.format(form.artist_id.data),
+      )
   except:
     db.session.rollback()
     error = True
@@ -474,40 +848,188 @@ def create_show_submission():
   
   if error:
     flash('An error occurred. Show could not be listed.')
+  elif clash_time is not None:
+    flash(
+      'Show could not be listed: the venue or artist is already booked for '
+      + format_datetime(clash_time, 'full') + '.'
+    )
   else:
     flash('Show was successfully listed!')
   return render_template('pages/home.html')
 
 
-@app.route('/shows/search', methods=['POST'])
+@app.route('/shows/search', methods=['GET', 'POST'])
+@replica_reads
 def search_shows():
   """Search past and upcoming shows by artist or venue name."""
-  search_term = "%{}%".format(request.form["search_term"])
-  shows = Show.query.join(Artist).join(Venue).filter(
+  search_term, page, per_page = search_params()
+  pattern = "%{}%".format(search_term)
+  # Match each name table through its own trigram index, then pick the
+  # shows of the matching artists and venues.
+  matching_artists = db.session.query(Artist.id).filter(
+    Artist.name.ilike(pattern)
+  )
+  matching_venues = db.session.query(Venue.id).filter(
+    Venue.name.ilike(pattern)
+  )
+  matches = Show.query.filter(
     or_(
-      Artist.name.ilike(search_term),
-      Venue.name.ilike(search_term),
-    )).all()
+      Show.artist_id.in_(matching_artists),
+      Show.venue_id.in_(matching_venues),
+    ))
+  rank = func.greatest(
+    func.similarity(Artist.name, search_term),
+    func.similarity(Venue.name, search_term),
+  )
+  shows = matches.join(Artist).join(Venue).with_entities(
+    Show.id,
+    Show.start_time,
+    Show.artist_id,
+    Artist.name.label('artist_name'),
+    Artist.image_link.label('artist_image_link'),
+    Show.venue_id,
+    Venue.name.label('venue_name'),
+  ).order_by(
+    rank.desc(), Show.start_time, Show.id
+  ).limit(per_page).offset((page - 1) * per_page).all()
 
   response = {
-    "count": len(shows),
+    "count": matches.count(),
+    "page": page,
+    "per_page": per_page,
     "data": [
       {
         "id": show.id,
-        "artist_name": show.artist.name,
-        "venue_name": show.venue.name,
+        "artist_id": show.artist_id,
+        "artist_name": show.artist_name,
+        "artist_image_link": show.artist_image_link,
+        "venue_id": show.venue_id,
+        "venue_name": show.venue_name,
         "start_time": show.start_time,
       }
       for show in shows
     ]
   }
-  return render_template(
+  return respond(
     'pages/search_shows.html',
+    response,
     results=response,
-    search_term=request.form.get('search_term', '')
+    search_term=search_term
   )
 
 
+#  Batch API
+#  ----------------------------------------------------------------
+
+@app.route('/api/<any(venues, artists, shows):kind>/batch', methods=['POST'])
+def create_batch(kind):
+  """Create many venues, artists or shows from a JSON array.
+
+  Responds 201 when every item was created, 207 when only some were and
+  400 when none were, with one result per item in request order.
+  """
+  items = request.get_json(silent=True)
+  if isinstance(items, dict):
+    items = items.get('items')
+  if not isinstance(items, list) or not items:
+    return jsonify({
+      "success": False,
+      "error": "expected a non-empty JSON array of items",
+    }), 400
+  if len(items) > app.config['BATCH_MAX_ITEMS']:
+    return jsonify({
+      "success": False,
+      "error": "at most {} items per request".format(
+        app.config['BATCH_MAX_ITEMS']
+      ),
+    }), 413
+
+  try:
+    results, rows = batch.create_batch(
+      kind, items, timedelta(hours=app.config['SHOW_SLOT_HOURS'])
+    )
+  except Exception:
+    app.logger.exception('Batch of %d %s failed', len(items), kind)
+    return jsonify({
+      "success": False,
+      "error": "the batch could not be saved; nothing was created",
+    }), 500
+  finally:
+    db.session.close()
+
+  if rows:
+    if kind == 'shows':
+      response_cache.invalidate('shows', 'venues', 'artists', *(
+        ['venue:{}'.format(venue_id)
+         for venue_id in {row['venue_id'] for row in rows}]
+        + ['artist:{}'.format(artist_id)
+           for artist_id in {row['artist_id'] for row in rows}]
+      ))
+    else:
+      response_cache.invalidate(kind, *[
+        'suggested-{}:{}'.format(kind, state)
+        for state in {row['state'] for row in rows}
+      ])
+
+  status = 201 if len(rows) == len(items) else 207 if rows else 400
+  return jsonify({
+    "success": bool(rows),
+    "created": len(rows),
+    "rejected": len(items) - len(rows),
+    "results": results,
+  }), status
+
+
+#  Admin
+#  ----------------------------------------------------------------
+
+def admin_only(view):
+  """Hide a diagnostics endpoint unless ADMIN_ENDPOINTS_ENABLED is set."""
+  @wraps(view)
+  def wrapper(*args, **kwargs):
+    if not app.config['ADMIN_ENDPOINTS_ENABLED']:
+      abort(404)
+    return view(*args, **kwargs)
+  return wrapper
+
+@app.route('/admin/cache')
+@admin_only
+def cache_stats():
+  """Report response cache hit/miss and eviction counters."""
+  return jsonify(response_cache.stats())
+
+@app.route('/admin/pool')
+@admin_only
+def pool_stats():
+  """Report connection pool usage and checkout waits for every engine."""
+  engines = [('primary', None)] + [
+    (bind, bind) for bind in sorted(app.config['SQLALCHEMY_BINDS'] or ())
+  ]
+  pools = {}
+  for name, bind in engines:
+    pool = db.get_engine(app, bind=bind).pool
+    if hasattr(pool, 'describe'):
+      pools[name] = pool.describe()
+    else:
+      pools[name] = {"status": pool.status()}
+  return jsonify({"pools": pools})
+
+@app.route('/admin/sql')
+@admin_only
+def sql_stats():
+  """Report the routes issuing the most SQL, with likely N+1 patterns."""
+  sort = request.args.get('sort', 'avg_queries')
+  if sort not in ('avg_queries', 'max_queries', 'avg_db_time_ms',
+                  'db_time_ms', 'n_plus_one_requests'):
+    abort(400)
+  return jsonify({
+    "enabled": sql_instrumentation.enabled,
+    "routes": sql_instrumentation.worst_routes(
+      limit=request.args.get('limit', 10, type=int), key=sort
+    ),
+  })
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -0,0 +1,262 @@
+"""Fingerprinted, pre-compressed static assets.
+
+``flask assets build`` copies every file under the ASSET_SOURCES
+directories to static/dist/ under a name carrying a hash of its
+content, rewrites url() references between stylesheets and the files
+they load to the hashed names, stores .gz (and, with the brotli package
+installed, .br) variants of compressible files next to them and writes
+static/dist/manifest.json mapping each logical path to its hashed path.
+Files of earlier builds are kept, so pages rendered before a deploy can
+still load them; ``flask assets build --prune`` removes them once every
+worker serves the new manifest.
+
+Once a manifest exists, url_for('static', filename=...) points at the
+hashed file, which is served with a year-long immutable Cache-Control
+and the smallest encoding the client accepts. Files missing from the
+manifest are served from their source directory as before. A running
+app rereads the manifest when a build replaces it.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from posixpath import dirname, join, normpath, relpath
+
+import click
+from flask import abort, current_app, request, send_from_directory
+from flask.cli import AppGroup, with_appcontext
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = frozenset([
+  '.css', '.js', '.map', '.json', '.svg', '.txt', '.eot', '.otf', '.ttf',
+])
+# Preferred first; each is (Content-Encoding, file suffix).
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+IMMUTABLE = 'public, max-age={}, immutable'
+
+_CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+assets_cli = AppGroup('assets', help='Build fingerprinted static assets.')
+
+
+#----------------------------------------------------------------------------#
+# Build.
+#----------------------------------------------------------------------------#
+
+def _hashed_name(path, content):
+  stem, ext = os.path.splitext(path)
+  return '{}.{}{}'.format(stem, hashlib.md5(content).hexdigest()[:12], ext)
+
+
+def _source_files(app):
+  """Yield (logical path, file path) for every source asset."""
+  dist = os.path.join(app.static_folder, DIST)
+  for prefix, directory in app.config['ASSET_SOURCES'].items():
+    directory = os.path.join(app.root_path, directory)
+    for folder, dirs, files in os.walk(directory):
+      dirs[:] = sorted(
+        name for name in dirs if os.path.join(folder, name) != dist
+      )
+      for name in sorted(files):
+        if name.startswith('.'):
+          continue
+        path = os.path.join(folder, name)
+        logical = os.path.relpath(path, directory).replace(os.sep, '/')
+        yield join(prefix, logical) if prefix else logical, path
+
+
+def _rewrite_css(logical, css, manifest):
+  """Point url() references of the stylesheet at logical to hashed files."""
+  base = dirname(logical)
+
+  def replace(match):
+    quote, url = match.groups()
+    if re.match(r'^([a-z]+:|/|#)', url):
+      return match.group(0)
+    target, suffix = re.match(r'^([^?#]*)(.*)$', url).groups()
+    hashed = manifest.get(normpath(join(base, target)))
+    if hashed is None:
+      return match.group(0)
+    url = relpath(hashed, base or '.') + suffix
+    return 'url({0}{1}{0})'.format(quote, url)
+
+  return _CSS_URL.sub(replace, css)
+
+
+def _write(path, content):
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  with open(path, 'wb') as out:
+    out.write(content)
+
+
+def _compress(path, content):
+  """Write the encoded variants of content that are smaller than it."""
+  variants = [('.gz', gzip.compress(content, 9, mtime=0))]
+  if brotli is not None:
+    variants.append(('.br', brotli.compress(content)))
+  for suffix, encoded in variants:
+    if len(encoded) < len(content):
+      _write(path + suffix, encoded)
+
+
+def _prune(dist, manifest):
+  """Remove the files of static/dist/ the manifest doesn't refer to."""
+  keep = set([MANIFEST])
+  for hashed in manifest.values():
+    keep.update(hashed + suffix for suffix in [''] + [
+      suffix for _, suffix in ENCODINGS
+    ])
+  for folder, dirs, files in os.walk(dist, topdown=False):
+    for name in files:
+      path = os.path.join(folder, name)
+      if os.path.relpath(path, dist).replace(os.sep, '/') not in keep:
+        os.remove(path)
+    if folder != dist and not os.listdir(folder):
+      os.rmdir(folder)
+
+
+def build(app, prune=False):
+  """Build static/dist/ and its manifest; return the manifest.
+
+  Hashed files of earlier builds stay in place unless prune is set.
+  """
+  dist = os.path.join(app.static_folder, DIST)
+  sources = list(_source_files(app))
+  # Stylesheets are hashed last, once the files they load have names.
+  sources.sort(key=lambda source: source[0].endswith('.css'))
+  manifest = {}
+  for logical, path in sources:
+    with open(path, 'rb') as source:
+      content = source.read()
+    if logical.endswith('.css'):
+      content = _rewrite_css(
+        logical, content.decode('utf-8'), manifest
+      ).encode('utf-8')
+    hashed = _hashed_name(logical, content)
+    manifest[logical] = hashed
+    target = os.path.join(dist, *hashed.split('/'))
+    _write(target, content)
+    if os.path.splitext(logical)[1].lower() in COMPRESSIBLE:
+      _compress(target, content)
+
+  # Replace the manifest in one step; workers may be reading it.
+  path = os.path.join(dist, MANIFEST)
+  _write(
+    path + '.tmp',
+    json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'),
+  )
+  os.replace(path + '.tmp', path)
+  if prune:
+    _prune(dist, manifest)
+  return manifest
+
+
+@assets_cli.command('build')
+@click.option('--prune', is_flag=True,
+              help='Remove the files of earlier builds.')
+@with_appcontext
+def build_command(prune):
+  """Fingerprint and pre-compress the static assets."""
+  manifest = build(current_app, prune)
+  click.echo('Built {} assets into static/{}/.'.format(len(manifest), DIST))
+
+
+#----------------------------------------------------------------------------#
+# Serving.
+#----------------------------------------------------------------------------#
+
+class Assets(object):
+  """Rewrites static URLs to hashed files and serves them."""
+
+  def __init__(self):
+    self.manifest = {}
+    self.manifest_mtime = None
+    # Hash of the manifest; pages linking to assets depend on it.
+    self.digest = ''
+
+  def init_app(self, app):
+    self.max_age = app.config['STATIC_IMMUTABLE_MAX_AGE']
+    self.sources = app.config['ASSET_SOURCES']
+    self.load(app)
+    app.before_request(self._reload)
+    app.url_defaults(self._hashed_url)
+    app.view_functions['static'] = self.send_static_file
+    app.cli.add_command(assets_cli)
+
+  def load(self, app):
+    """Read the manifest written by the last build, if there is one."""
+    path = os.path.join(app.static_folder, DIST, MANIFEST)
+    try:
+      mtime = os.stat(path).st_mtime
+    except OSError:
+      return
+    if mtime != self.manifest_mtime:
+      with open(path, 'rb') as manifest:
+        content = manifest.read()
+      self.manifest = json.loads(content.decode('utf-8'))
+      self.digest = hashlib.sha1(content).hexdigest()
+      self.manifest_mtime = mtime
+
+  def _reload(self):
+    self.load(current_app)
+
+  def _hashed_url(self, endpoint, values):
+    if endpoint == 'static' and values.get('filename') in self.manifest:
+      values['filename'] = join(DIST, self.manifest[values['filename']])
+
+  def send_static_file(self, filename):
+    app = current_app._get_current_object()
+    # The manifest is internal to the app, whichever way it is requested.
+    if normpath(filename) == join(DIST, MANIFEST):
+      abort(404)
+    dist_prefix = DIST + '/'
+    hashed = filename[len(dist_prefix):]
+    # Any built file is served, including those of earlier builds.
+    if (filename.startswith(dist_prefix)
+        and os.path.isfile(os.path.join(app.static_folder, DIST, hashed))):
+      return self._send_hashed(app, hashed)
+
+    # Not built (or not fingerprinted): serve from the source directory.
+    for prefix, directory in sorted(self.sources.items(), reverse=True):
+      if prefix and not filename.startswith(prefix + '/'):
+        continue
+      path = filename[len(prefix) + 1:] if prefix else filename
+      directory = os.path.join(app.root_path, directory)
+      if os.path.isfile(os.path.join(directory, path)):
+        return send_from_directory(directory, path)
+    return app.send_static_file(filename)
+
+  def _send_hashed(self, app, hashed):
+    directory = os.path.join(app.static_folder, DIST)
+    encoding = None
+    for name, suffix in ENCODINGS:
+      if (request.accept_encodings[name]
+          and os.path.isfile(os.path.join(directory, hashed + suffix))):
+        encoding = name, suffix
+        break
+
+    if encoding is None:
+      response = send_from_directory(
+        directory, hashed, cache_timeout=self.max_age
+      )
+    else:
+      mimetype = mimetypes.guess_type(hashed)[0] or 'application/octet-stream'
+      response = send_from_directory(
+        directory, hashed + encoding[1], mimetype=mimetype,
+        cache_timeout=self.max_age
+      )
+      response.headers['Content-Encoding'] = encoding[0]
+    response.headers['Cache-Control'] = IMMUTABLE.format(self.max_age)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+assets = Assets()
@@ -0,0 +1,136 @@
+"""Create many venues, artists or shows from one JSON request.
+
+Items are validated with the same cleaners as the bulk importer. For
+shows, the referenced venues and artists are looked up and locked with
+one query per table and booking clashes are found with one range query
+for the whole batch. The valid items get ids drawn from the table's
+sequence up front, since RETURNING rows come back in no guaranteed
+order, and are inserted with a single multi-row INSERT in one
+transaction, which also indexes new venues and artists for
+matchmaking. Each item gets a result saying whether it was created
+(with its id) or why it was not.
+"""
+from bulk import KINDS, RecordError, existing_ids, sync_id_sequence
+from models import db, Show
+import counters
+import matchmaking
+import schedule
+
+
+def _created(index, entity_id):
+  return {"index": index, "status": "created", "id": entity_id}
+
+
+def _rejected(index, message):
+  return {"index": index, "status": "error", "error": message}
+
+
+def _clean(kind, items, results):
+  """Return {index: row} for the items that pass validation."""
+  clean = KINDS[kind][1]
+  rows = {}
+  for index, item in enumerate(items):
+    try:
+      if not isinstance(item, dict):
+        raise RecordError('expected a JSON object')
+      row = clean(item)
+    except RecordError as e:
+      results[index] = _rejected(index, str(e))
+      continue
+    # Ids are always drawn from the sequence here.
+    row.pop('id', None)
+    rows[index] = row
+  return rows
+
+
+def _bookable(rows, slot, results):
+  """Drop shows with unknown parties or clashing bookings from rows.
+
+  Locks the referenced venue and artist rows until the transaction ends.
+  """
+  venues, artists = schedule.lock_parties(
+    sorted({row['venue_id'] for row in rows.values()}),
+    sorted({row['artist_id'] for row in rows.values()}),
+  )
+  for index, row in list(rows.items()):
+    if row['venue_id'] not in venues:
+      message = 'venue {} does not exist'.format(row['venue_id'])
+    elif row['artist_id'] not in artists:
+      message = 'artist {} does not exist'.format(row['artist_id'])
+    else:
+      continue
+    results[index] = _rejected(index, message)
+    del rows[index]
+
+  clashes = schedule.batch_booking_conflicts({
+    index: (row['venue_id'], row['artist_id'], row['start_time'])
+    for index, row in rows.items()
+  }, slot)
+  for index, clash_time in clashes.items():
+    results[index] = _rejected(
+      index,
+      'the venue or artist is already booked for {}'.format(
+        clash_time.isoformat()
+      ),
+    )
+    del rows[index]
+
+
+def _draw_ids(model, count):
+  return [entity_id for entity_id, in db.session.execute(
+    "SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+    "FROM generate_series(1, :count)",
+    {'table': '"{}"'.format(model.__tablename__), 'count': count},
+  )]
+
+
+def _allocate_ids(model, count):
+  """Draw count ids from the id sequence of model's table.
+
+  The primary key of the partitioned Show table is (id, start_time), so
+  it does not reject a show id that is already in use. If shows were
+  imported with explicit ids past the sequence, it is moved past them
+  and the ids are drawn again.
+  """
+  ids = _draw_ids(model, count)
+  if model is Show and existing_ids(Show, ids):
+    sync_id_sequence(Show)
+    ids = _draw_ids(model, count)
+  return ids
+
+
+def create_batch(kind, items, slot):
+  """Validate and insert items of kind in one transaction.
+
+  Returns (results, rows): one result dict per item, in item order, and
+  the column values of the rows that were inserted. Nothing is inserted
+  if the database rejects the statement.
+  """
+  model = KINDS[kind][0]
+  results = [None] * len(items)
+  try:
+    rows = _clean(kind, items, results)
+    if kind == 'shows' and rows:
+      _bookable(rows, slot, results)
+    if rows:
+      indexes = sorted(rows)
+      table = model.__table__
+      ids = _allocate_ids(model, len(indexes))
+      for index, entity_id in zip(indexes, ids):
+        rows[index]['id'] = entity_id
+        results[index] = _created(index, entity_id)
+      db.session.execute(
+        table.insert().values([rows[index] for index in indexes])
+      )
+      if kind == 'shows':
+        counters.record_shows_created(
+          (row['venue_id'], row['artist_id'], row['start_time'])
+          for row in rows.values()
+        )
+      else:
+        matchmaking.reindex(kind[:-1], ids)
+    db.session.commit()
+  except Exception:
+    db.session.rollback()
+    raise
+  return results, list(rows.values())
@@ -0,0 +1,58 @@
+"""Micro-benchmark of the |datetime filter on a 10k-show page.
+
+Compares the previous filter (dateutil re-parse plus babel's
+format_datetime per value) with formatting.format_datetime and the
+batch formatting.format_datetimes. Run from the starter_code directory:
+
+    python benchmarks/bench_format_datetime.py
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formatting import NAMED_FORMATS, format_datetime, format_datetimes  # noqa
+
+SHOWS = 10000
+LOCALE = 'en_US'
+
+
+def previous_format_datetime(value, format='medium'):
+  """The filter as it was before the formatting module."""
+  date = dateutil.parser.parse(str(value))
+  return babel.dates.format_datetime(
+    date, NAMED_FORMATS.get(format, format), locale=LOCALE
+  )
+
+
+def main():
+  start = datetime(2021, 1, 1, 20, 0)
+  values = [start + timedelta(hours=7 * i) for i in range(SHOWS)]
+  assert [previous_format_datetime(v, 'full') for v in values[:50]] == \
+    format_datetimes(values[:50], 'full', LOCALE)
+
+  cases = [
+    ('previous filter', lambda: [
+      previous_format_datetime(v, 'full') for v in values
+    ]),
+    ('format_datetime', lambda: [
+      format_datetime(v, 'full', LOCALE) for v in values
+    ]),
+    ('format_datetimes', lambda: format_datetimes(values, 'full', LOCALE)),
+  ]
+  baseline = None
+  for name, run in cases:
+    best = min(timeit.repeat(run, number=1, repeat=5))
+    baseline = baseline or best
+    print('{:<18} {:8.1f} ms per {} shows  ({:.1f}x)'.format(
+      name, best * 1000, SHOWS, baseline / best
+    ))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,348 @@
+"""Load benchmark of every Fyyur route through the Flask test client.
+
+Each scenario requests one route repeatedly against the database
+configured in config.py (load it first with benchmarks/dataset.py) and
+reports p50/p95/p99 latency, average SQL queries per request from the
+SQL instrumentation, and the peak memory the route allocated. Memory is
+traced with tracemalloc over a few more requests after the timed ones,
+so tracing doesn't slow them; it counts Python allocations only. With
+--writes the form, delete and batch API routes are benchmarked too;
+they add venues, artists and shows, rewrite sampled rows with their own
+values and delete venues created for the purpose.
+Results can be saved as a baseline and later runs compared against it;
+the comparison exits non-zero when a route got slower or issues more
+queries than the tolerance allows. Run from the starter_code directory:
+
+    python benchmarks/bench_routes.py --save benchmarks/baseline.json
+    python benchmarks/bench_routes.py --compare benchmarks/baseline.json
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from itertools import count, cycle
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch  # noqa
+from app import app  # noqa
+from cache import response_cache  # noqa
+from instrumentation import sql_instrumentation  # noqa
+from models import db, Artist, Venue  # noqa
+
+JSON = {'Accept': 'application/json'}
+VENUE_FIELDS = [
+  'name', 'city', 'state', 'address', 'phone', 'image_link', 'genres',
+  'facebook_link', 'website', 'seeking_talent', 'seeking_description',
+]
+ARTIST_FIELDS = [
+  'name', 'city', 'state', 'phone', 'image_link', 'genres', 'facebook_link',
+  'website', 'seeking_venue', 'seeking_description',
+]
+
+
+def _percentile(ordered, fraction):
+  return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _ids(model, rng, size):
+  """Return size ids of model, sampled with a fixed generator."""
+  top = db.session.query(db.func.max(model.id)).scalar() or 0
+  if not top:
+    raise SystemExit('No {} rows; load a dataset first.'.format(
+      model.__tablename__
+    ))
+  return [rng.randint(1, top) for _ in range(size)]
+
+
+def _edits(model, ids, fields):
+  """Return (id, form data) pairs that submit rows' own values again."""
+  return [
+    (entity.id, _form(entity, fields))
+    for entity in model.query.filter(model.id.in_(set(ids)))
+  ]
+
+
+def _form(entity, fields):
+  """Return the form data that submits entity's values of fields again."""
+  data = {}
+  for field in fields:
+    value = getattr(entity, field)
+    if isinstance(value, bool):
+      if value:
+        data[field] = 'y'
+    elif value is not None:
+      data[field] = value
+  return data
+
+
+def _new(kind, number):
+  """Return the fields of the number-th benchmark venue or artist."""
+  fields = {
+    'name': 'Benchmark {} {}'.format(kind, number), 'city': 'Oakland',
+    'state': 'CA', 'phone': '510-555-0100', 'genres': ['Jazz'],
+    'facebook_link': 'https://www.facebook.com/benchmark',
+    'website': 'https://example.com/',
+  }
+  if kind == 'venue':
+    fields['address'] = '1 Broadway'
+  return fields
+
+
+def _disposable_venues(size, artist_ids, starts):
+  """Create size venues, each with one show, for the delete scenario."""
+  results, _ = batch.create_batch('venues', [
+    _new('venue', 'to delete {}'.format(number)) for number in range(size)
+  ], None)
+  venue_ids = [result['id'] for result in results]
+  slot = timedelta(hours=app.config['SHOW_SLOT_HOURS'])
+  batch.create_batch('shows', [
+    {'venue_id': venue_id, 'artist_id': artist_id,
+     'start_time': next(starts).isoformat()}
+    for venue_id, artist_id in zip(venue_ids, cycle(artist_ids))
+  ], slot)
+  return venue_ids
+
+
+def scenarios(rng, requests, writes, deletions=0):
+  """Return (name, method, url builder, kwargs builder) per scenario.
+
+  Detail routes cycle through a sample of ids so one hot row does not
+  flatter them. The delete scenario gets deletions venues of its own.
+  """
+  venue_ids = _ids(Venue, rng, requests)
+  artist_ids = _ids(Artist, rng, requests)
+
+  def fixed(url):
+    return lambda: url
+
+  def cycling(template, sample):
+    values = cycle(sample)
+    return lambda: template.format(next(values))
+
+  def search(term):
+    return {'data': {'search_term': term}}
+
+  cases = [
+    ('home', 'GET', fixed('/'), None),
+    ('venues', 'GET', fixed('/venues'), None),
+    ('venues.json', 'GET', fixed('/venues'), {'headers': JSON}),
+    ('venues/browse', 'GET',
+     fixed('/venues/browse?genre=Jazz&state=CA'), None),
+    ('venues/search', 'POST', fixed('/venues/search'), search('the')),
+    ('venues/<id>', 'GET', cycling('/venues/{}', venue_ids), None),
+    ('venues/<id>.json', 'GET', cycling('/venues/{}', venue_ids),
+     {'headers': JSON}),
+    ('venues/<id>/calendar', 'GET',
+     cycling('/venues/{}/calendar?next=20', venue_ids), None),
+    ('venues/<id>/edit', 'GET', cycling('/venues/{}/edit', venue_ids), None),
+    ('venues/create', 'GET', fixed('/venues/create'), None),
+    ('artists', 'GET', fixed('/artists'), None),
+    ('artists/browse', 'GET',
+     fixed('/artists/browse?genre=Punk&seeking=1'), None),
+    ('artists/search', 'POST', fixed('/artists/search'), search('wolves')),
+    ('artists/<id>', 'GET', cycling('/artists/{}', artist_ids), None),
+    ('artists/<id>/calendar', 'GET',
+     cycling('/artists/{}/calendar?next=20', artist_ids), None),
+    ('artists/<id>/edit', 'GET',
+     cycling('/artists/{}/edit', artist_ids), None),
+    ('artists/create', 'GET', fixed('/artists/create'), None),
+    ('shows', 'GET', fixed('/shows'), None),
+    ('shows.json', 'GET', fixed('/shows'), {'headers': JSON}),
+    ('shows/search', 'POST', fixed('/shows/search'), search('blue')),
+    ('shows/create', 'GET', fixed('/shows/create'), None),
+    ('admin/cache', 'GET', fixed('/admin/cache'), None),
+    ('admin/pool', 'GET', fixed('/admin/pool'), None),
+    ('admin/sql', 'GET', fixed('/admin/sql?limit=50'), None),
+  ]
+  if writes:
+    starts = (datetime(2030, 1, 1) + timedelta(hours=7 * i) for i in count())
+    venue_cycle, artist_cycle = cycle(venue_ids), cycle(artist_ids)
+    venue_edits = _edits(Venue, venue_ids, VENUE_FIELDS)
+    artist_edits = _edits(Artist, artist_ids, ARTIST_FIELDS)
+    deleted = iter(_disposable_venues(deletions, artist_ids, starts))
+    numbers = count()
+
+    def resubmit(edits):
+      forms = cycle([{'data': data} for _, data in edits])
+      return lambda: next(forms)
+
+    def create(kind, size=None):
+      if size is None:
+        return lambda: {'data': _new(kind, next(numbers))}
+      return lambda: {
+        'json': [_new(kind, next(numbers)) for _ in range(size)]
+      }
+
+    cases += [
+      ('shows/create POST', 'POST', fixed('/shows/create'), lambda: {
+        'data': {
+          'venue_id': next(venue_cycle),
+          'artist_id': next(artist_cycle),
+          'start_time': next(starts).strftime('%Y-%m-%d %H:%M:%S'),
+        },
+      }),
+      ('api/shows/batch', 'POST', fixed('/api/shows/batch'), lambda: {
+        'json': [
+          {
+            'venue_id': next(venue_cycle),
+            'artist_id': next(artist_cycle),
+            'start_time': next(starts).isoformat(),
+          }
+          for _ in range(2)
+        ],
+      }),
+      ('venues/create POST', 'POST', fixed('/venues/create'),
+       create('venue')),
+      ('artists/create POST', 'POST', fixed('/artists/create'),
+       create('artist')),
+      ('venues/<id>/edit POST', 'POST',
+       cycling('/venues/{}/edit', [venue_id for venue_id, _ in venue_edits]),
+       resubmit(venue_edits)),
+      ('artists/<id>/edit POST', 'POST',
+       cycling('/artists/{}/edit',
+               [artist_id for artist_id, _ in artist_edits]),
+       resubmit(artist_edits)),
+      ('venues/<id> delete', 'POST', lambda: '/venues/{}'.format(
+        next(deleted)
+      ), None),
+      ('api/venues/batch', 'POST', fixed('/api/venues/batch'),
+       create('venue', 2)),
+      ('api/artists/batch', 'POST', fixed('/api/artists/batch'),
+       create('artist', 2)),
+    ]
+  return cases
+
+
+def run_scenario(client, method, url, kwargs, requests, warmup):
+  """Return the sorted latencies (seconds) of requests requests."""
+  latencies = []
+  for number in range(warmup + requests):
+    options = kwargs() if callable(kwargs) else dict(kwargs or {})
+    started = time.perf_counter()
+    response = client.open(url(), method=method, **options)
+    response.get_data()
+    elapsed = time.perf_counter() - started
+    if response.status_code >= 500:
+      raise SystemExit('{} {} answered {}'.format(
+        method, response.request.path, response.status_code
+      ))
+    if number >= warmup:
+      latencies.append(elapsed)
+  return sorted(latencies)
+
+
+def peak_alloc_mb(client, method, url, kwargs, requests):
+  """Return the peak memory (MB) allocated while serving requests requests.
+
+  Only allocations made after tracing starts count, so the figure is the
+  route's own, whatever earlier routes left behind.
+  """
+  tracemalloc.start()
+  try:
+    run_scenario(client, method, url, kwargs, requests, warmup=0)
+    peak = tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+  return peak / 1048576.0
+
+
+def benchmark(requests, warmup, seed, writes, cache, memory_requests):
+  # The instrumentation hooks are registered by init_app when enabled.
+  app.config.update(
+    SQL_INSTRUMENTATION=True, SQL_N_PLUS_ONE_THRESHOLD=10 ** 9,
+    WTF_CSRF_ENABLED=False, ADMIN_ENDPOINTS_ENABLED=True,
+  )
+  sql_instrumentation.init_app(app)
+  app.logger.setLevel(logging.WARNING)
+  response_cache.enabled = cache
+
+  with app.app_context():
+    cases = scenarios(
+      random.Random(seed), requests, writes,
+      deletions=warmup + requests + memory_requests,
+    )
+  client = app.test_client()
+  results = {}
+  for name, method, url, kwargs in cases:
+    sql_instrumentation.reset()
+    latencies = run_scenario(client, method, url, kwargs, requests, warmup)
+    routes = sql_instrumentation.worst_routes(limit=None)
+    served = sum(route['requests'] for route in routes)
+    queries = sum(route['queries'] for route in routes)
+    results[name] = {
+      'p50_ms': _percentile(latencies, .50) * 1000,
+      'p95_ms': _percentile(latencies, .95) * 1000,
+      'p99_ms': _percentile(latencies, .99) * 1000,
+      'queries': float(queries) / served if served else 0.0,
+      'peak_alloc_mb': peak_alloc_mb(
+        client, method, url, kwargs, memory_requests
+      ),
+    }
+    print('{:<24} p50 {p50_ms:8.2f}  p95 {p95_ms:8.2f}  p99 {p99_ms:8.2f} ms'
+          '  {queries:6.1f} queries  {peak_alloc_mb:7.2f} MB'.format(
+            name, **results[name]))
+  return results
+
+
+def compare(results, baseline, tolerance):
+  """Print and return the routes that regressed against baseline."""
+  regressions = []
+  for name, result in sorted(results.items()):
+    before = baseline.get(name)
+    if before is None:
+      continue
+    if result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+      regressions.append('{}: p95 {:.2f} ms, baseline {:.2f} ms'.format(
+        name, result['p95_ms'], before['p95_ms']
+      ))
+    if result['queries'] > before['queries'] + 0.5:
+      regressions.append('{}: {:.1f} queries, baseline {:.1f}'.format(
+        name, result['queries'], before['queries']
+      ))
+  for regression in regressions:
+    print('REGRESSION ' + regression)
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--requests', type=int, default=50,
+                      help='Measured requests per route.')
+  parser.add_argument('--warmup', type=int, default=5)
+  parser.add_argument('--memory-requests', type=int, default=5,
+                      help='Requests per route traced for peak memory.')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--writes', action='store_true',
+                      help='Also benchmark the routes that write.')
+  parser.add_argument('--cache', action='store_true',
+                      help='Leave the response cache on.')
+  parser.add_argument('--save', metavar='PATH',
+                      help='Write the results as a baseline.')
+  parser.add_argument('--compare', metavar='PATH',
+                      help='Compare the results with a saved baseline.')
+  parser.add_argument('--tolerance', type=float, default=0.25,
+                      help='Allowed relative p95 slowdown (default 0.25).')
+  args = parser.parse_args()
+
+  results = benchmark(
+    args.requests, args.warmup, args.seed, args.writes, args.cache,
+    args.memory_requests,
+  )
+  if args.save:
+    with open(args.save, 'w') as out:
+      json.dump(results, out, indent=2, sort_keys=True)
+      out.write('\n')
+  if args.compare:
+    with open(args.compare) as source:
+      if compare(results, json.load(source), args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
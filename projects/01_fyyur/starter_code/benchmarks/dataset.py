@@ -0,0 +1,206 @@
+"""Deterministic synthetic Fyyur dataset for the benchmarks.
+
+Generates venues, artists and shows from a seeded random generator, so
+the same seed and sizes always produce the same rows. Cities, genres
+and show bookings follow Zipf-like skews: a few big cities hold most
+venues, rock and pop outnumber musical theatre, and popular venues and
+artists play far more shows than the long tail. Rows are loaded through
+the bulk importer with explicit ids into empty tables. Run from the
+starter_code directory:
+
+    python benchmarks/dataset.py --size small
+    python benchmarks/dataset.py --size full --reset
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from bisect import bisect
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SIZES = {
+  'tiny': (100, 1000, 10000),
+  'small': (1000, 10000, 100000),
+  'full': (10000, 100000, 2000000),
+}
+
+# Cities by how many venues and artists they attract, busiest first.
+CITIES = [
+  ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'),
+  ('San Francisco', 'CA'), ('Austin', 'TX'), ('Nashville', 'TN'),
+  ('Seattle', 'WA'), ('Atlanta', 'GA'), ('Boston', 'MA'),
+  ('New Orleans', 'LA'), ('Denver', 'CO'), ('Portland', 'OR'),
+  ('Philadelphia', 'PA'), ('Miami', 'FL'), ('Detroit', 'MI'),
+  ('Minneapolis', 'MN'), ('Washington', 'DC'), ('Phoenix', 'AZ'),
+  ('Memphis', 'TN'), ('Las Vegas', 'NV'), ('Salt Lake City', 'UT'),
+  ('Kansas City', 'MO'), ('Baltimore', 'MD'), ('Honolulu', 'HI'),
+  ('Anchorage', 'AK'),
+]
+GENRES = [
+  'Rock n Roll', 'Pop', 'Hip-Hop', 'Alternative', 'Electronic', 'Jazz',
+  'R&B', 'Country', 'Folk', 'Punk', 'Blues', 'Soul', 'Heavy Metal',
+  'Reggae', 'Funk', 'Classical', 'Instrumental', 'Other', 'Musical Theatre',
+]
+ADJECTIVES = [
+  'Blue', 'Golden', 'Electric', 'Velvet', 'Crimson', 'Silver', 'Midnight',
+  'Wild', 'Lucky', 'Rusty', 'Neon', 'Hidden', 'Broken', 'Royal', 'Lonely',
+]
+NOUNS = [
+  'Room', 'Lounge', 'Hall', 'Garage', 'Tavern', 'Theater', 'Cellar',
+  'Ballroom', 'Saloon', 'Club', 'Barn', 'Parlor', 'Den', 'Dock', 'Attic',
+]
+BANDS = [
+  'Wolves', 'Echoes', 'Strangers', 'Machines', 'Rivers', 'Ghosts', 'Kings',
+  'Sparrows', 'Satellites', 'Drifters', 'Lanterns', 'Tides', 'Owls',
+]
+
+EPOCH = datetime(2024, 1, 1)
+SHOW_SPAN_DAYS = 3 * 365
+
+
+class Zipf(object):
+  """Draws indexes 0..n-1 with probability proportional to 1/(i+1)^s."""
+
+  def __init__(self, n, s=1.0):
+    self._cumulative = list(accumulate(1.0 / (i + 1) ** s for i in range(n)))
+
+  def draw(self, rng):
+    return bisect(self._cumulative, rng.random() * self._cumulative[-1])
+
+
+def _genres(rng, zipf):
+  return sorted({GENRES[zipf.draw(rng)] for _ in range(rng.randint(1, 3))})
+
+
+def venues(count, rng):
+  """Yield count venue records with ids 1..count."""
+  cities, genres = Zipf(len(CITIES)), Zipf(len(GENRES))
+  for venue_id in range(1, count + 1):
+    city, state = CITIES[cities.draw(rng)]
+    yield {
+      'id': venue_id,
+      'name': 'The {} {} {}'.format(
+        rng.choice(ADJECTIVES), rng.choice(NOUNS), venue_id
+      ),
+      'city': city,
+      'state': state,
+      'address': '{} {} St'.format(rng.randint(1, 9999), rng.choice(NOUNS)),
+      'phone': '{:03d}-{:03d}-{:04d}'.format(
+        rng.randint(200, 999), rng.randint(200, 999), rng.randint(0, 9999)
+      ),
+      'genres': _genres(rng, genres),
+      'seeking_talent': rng.random() < 0.3,
+      'seeking_description': None,
+    }
+
+
+def artists(count, rng):
+  """Yield count artist records with ids 1..count."""
+  cities, genres = Zipf(len(CITIES)), Zipf(len(GENRES))
+  for artist_id in range(1, count + 1):
+    city, state = CITIES[cities.draw(rng)]
+    yield {
+      'id': artist_id,
+      'name': '{} {} {}'.format(
+        rng.choice(ADJECTIVES), rng.choice(BANDS), artist_id
+      ),
+      'city': city,
+      'state': state,
+      'genres': _genres(rng, genres),
+      'seeking_venue': rng.random() < 0.4,
+    }
+
+
+def shows(count, venue_count, artist_count, rng):
+  """Yield count show records over skewed venues and artists.
+
+  Venue and artist popularity is drawn from a shuffled Zipf ranking, so
+  busy venues and artists are spread over the id range.
+  """
+  venue_ranks = list(range(1, venue_count + 1))
+  artist_ranks = list(range(1, artist_count + 1))
+  rng.shuffle(venue_ranks)
+  rng.shuffle(artist_ranks)
+  venue_zipf = Zipf(venue_count, 0.8)
+  artist_zipf = Zipf(artist_count, 0.8)
+  for show_id in range(1, count + 1):
+    day = rng.randrange(SHOW_SPAN_DAYS)
+    yield {
+      'id': show_id,
+      'venue_id': venue_ranks[venue_zipf.draw(rng)],
+      'artist_id': artist_ranks[artist_zipf.draw(rng)],
+      'start_time': EPOCH + timedelta(
+        days=day, hours=rng.randint(18, 23), minutes=rng.choice([0, 30])
+      ),
+    }
+
+
+def generate(venue_count, artist_count, show_count, seed=0):
+  """Return the (kind, records) pairs of one dataset, in load order."""
+  rng = random.Random(seed)
+  return [
+    ('venues', venues(venue_count, rng)),
+    ('artists', artists(artist_count, rng)),
+    ('shows', shows(show_count, venue_count, artist_count, rng)),
+  ]
+
+
+def load(venue_count, artist_count, show_count, seed=0, reset=False,
+         batch_size=5000):
+  """Load a generated dataset into the configured database."""
+  import bulk
+  import counters
+  from app import app
+  from models import db
+
+  with app.app_context():
+    if reset:
+      db.session.execute(
+        'TRUNCATE "Show", "Artist", "Venue" RESTART IDENTITY CASCADE'
+      )
+      db.session.commit()
+    for kind, records in generate(venue_count, artist_count, show_count, seed):
+      started = time.perf_counter()
+      imported, rejected = bulk.import_records(
+        kind, enumerate(records, 1), batch_size,
+        report=lambda line_no, message: print(
+          'record {}: {}'.format(line_no, message), file=sys.stderr
+        ),
+      )
+      print('{:>8} {:<8} in {:6.1f} s ({} rejected)'.format(
+        imported, kind, time.perf_counter() - started, rejected
+      ))
+    counters.rebuild()
+    db.session.execute('ANALYZE')
+    db.session.commit()
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--size', choices=sorted(SIZES), default='small')
+  parser.add_argument('--venues', type=int)
+  parser.add_argument('--artists', type=int)
+  parser.add_argument('--shows', type=int)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--batch-size', type=int, default=5000)
+  parser.add_argument('--reset', action='store_true',
+                      help='Empty the venue, artist and show tables first.')
+  args = parser.parse_args()
+
+  venue_count, artist_count, show_count = SIZES[args.size]
+  load(
+    args.venues or venue_count,
+    args.artists or artist_count,
+    args.shows or show_count,
+    seed=args.seed,
+    reset=args.reset,
+    batch_size=args.batch_size,
+  )
+
+
+if __name__ == '__main__':
+  main()
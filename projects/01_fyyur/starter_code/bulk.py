@@ -0,0 +1,463 @@
+"""Bulk import and export of venues, artists and shows.
+
+Records are read from and written to NDJSON (one JSON object per line)
+or CSV, where list-valued genres are joined with ';'. Imports validate
+each record against the same genre/state choices as the web forms and
+insert valid records in batches with one executemany per batch and one
+commit per batch. Exports walk the table through a server-side cursor,
+so neither direction holds a whole table in memory.
+"""
+import csv
+import json
+import sys
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy.exc import DBAPIError
+
+from forms import genre_choices, state_choices
+from models import db, Artist, Venue, Show
+import counters
+import matchmaking
+
+GENRES = frozenset(value for value, _ in genre_choices)
+STATES = frozenset(value for value, _ in state_choices)
+GENRE_SEPARATOR = ';'
+DEFAULT_BATCH_SIZE = 5000
+
+data_cli = AppGroup('data', help='Bulk import and export Fyyur records.')
+
+
+class RecordError(ValueError):
+  """Raised when an imported record does not pass validation."""
+
+
+#----------------------------------------------------------------------------#
+# Validation.
+#----------------------------------------------------------------------------#
+
+def _text(record, field, required=False, max_length=None):
+  value = record.get(field)
+  if value is None or value == '':
+    if required:
+      raise RecordError('{} is required'.format(field))
+    return None
+  if not isinstance(value, str):
+    raise RecordError('{} must be a string'.format(field))
+  value = value.strip()
+  if max_length and len(value) > max_length:
+    raise RecordError(
+      '{} is longer than {} characters'.format(field, max_length)
+    )
+  return value
+
+
+def _state(record):
+  state = _text(record, 'state', required=True)
+  if state not in STATES:
+    raise RecordError('unknown state {!r}'.format(state))
+  return state
+
+
+def _genres(record):
+  genres = record.get('genres') or []
+  if isinstance(genres, str):
+    genres = [genre.strip() for genre in genres.split(GENRE_SEPARATOR)]
+  if not isinstance(genres, list) or not genres:
+    raise RecordError('genres must be a non-empty list')
+  unknown = [genre for genre in genres if genre not in GENRES]
+  if unknown:
+    raise RecordError('unknown genres {!r}'.format(unknown))
+  return genres
+
+
+def _boolean(record, field):
+  value = record.get(field)
+  if isinstance(value, str):
+    value = value.strip().lower()
+    if value in ('', 'false', 'f', 'no', 'n', '0'):
+      return False
+    if value in ('true', 't', 'yes', 'y', '1'):
+      return True
+    raise RecordError('{} must be a boolean'.format(field))
+  return bool(value)
+
+
+def _integer(record, field, required=False):
+  value = record.get(field)
+  if value is None or value == '':
+    if required:
+      raise RecordError('{} is required'.format(field))
+    return None
+  # int() would accept True and truncate 2.7.
+  if isinstance(value, (bool, float)):
+    raise RecordError('{} must be an integer'.format(field))
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    raise RecordError('{} must be an integer'.format(field))
+
+
+def _datetime(record, field):
+  """Parse an ISO 8601 value into a naive local datetime.
+
+  start_time columns hold the server's local time, like the show form
+  and datetime.now() everywhere else. Times with an offset, like Fyyur's
+  own "2019-05-21T21:30:00.000Z", are converted to it.
+  """
+  value = record.get(field)
+  if not isinstance(value, datetime):
+    if isinstance(value, str) and value.endswith(('Z', 'z')):
+      value = value[:-1] + '+00:00'
+    try:
+      value = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+      raise RecordError('{} must be an ISO 8601 date and time'.format(field))
+  if value.tzinfo is not None:
+    value = value.astimezone().replace(tzinfo=None)
+  return value
+
+
+def _with_id(record, row):
+  record_id = _integer(record, 'id')
+  if record_id is not None:
+    row['id'] = record_id
+  return row
+
+
+def clean_venue(record):
+  """Validate a venue record and return its column values."""
+  return _with_id(record, {
+    'name': _text(record, 'name', required=True),
+    'city': _text(record, 'city', required=True, max_length=120),
+    'state': _state(record),
+    'address': _text(record, 'address', required=True, max_length=120),
+    'phone': _text(record, 'phone', max_length=120),
+    'image_link': _text(record, 'image_link', max_length=500),
+    'facebook_link': _text(record, 'facebook_link', max_length=120),
+    'website': _text(record, 'website', max_length=120),
+    'genres': _genres(record),
+    'seeking_talent': _boolean(record, 'seeking_talent'),
+    'seeking_description': _text(
+      record, 'seeking_description', max_length=500
+    ),
+  })
+
+
+def clean_artist(record):
+  """Validate an artist record and return its column values."""
+  return _with_id(record, {
+    'name': _text(record, 'name', required=True),
+    'city': _text(record, 'city', required=True, max_length=120),
+    'state': _state(record),
+    'phone': _text(record, 'phone', max_length=120),
+    'image_link': _text(record, 'image_link', max_length=500),
+    'facebook_link': _text(record, 'facebook_link', max_length=120),
+    'website': _text(record, 'website', max_length=120),
+    'genres': _genres(record),
+    'seeking_venue': _boolean(record, 'seeking_venue'),
+    'seeking_description': _text(
+      record, 'seeking_description', max_length=500
+    ),
+  })
+
+
+def clean_show(record):
+  """Validate a show record and return its column values.
+
+  Whether the referenced venue and artist exist is checked per batch by
+  missing_references().
+  """
+  return _with_id(record, {
+    'venue_id': _integer(record, 'venue_id', required=True),
+    'artist_id': _integer(record, 'artist_id', required=True),
+    'start_time': _datetime(record, 'start_time'),
+  })
+
+
+def existing_ids(model, ids):
+  """Return the set of ids that rows of model already have."""
+  if not ids:
+    return set()
+  return {
+    found for found, in db.session.query(model.id).filter(model.id.in_(ids))
+  }
+
+
+def missing_references(rows):
+  """Return the (venue ids, artist ids) that rows reference but don't exist.
+
+  Costs one query per referenced table, whatever the number of rows.
+  """
+  missing = []
+  for model, key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+    ids = {row[key] for row in rows}
+    missing.append(ids - existing_ids(model, ids))
+  return tuple(missing)
+
+
+KINDS = {
+  'venues': (Venue, clean_venue),
+  'artists': (Artist, clean_artist),
+  'shows': (Show, clean_show),
+}
+
+EXPORT_COLUMNS = {
+  'venues': [
+    'id', 'name', 'city', 'state', 'address', 'phone', 'image_link',
+    'facebook_link', 'website', 'genres', 'seeking_talent',
+    'seeking_description',
+  ],
+  'artists': [
+    'id', 'name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+    'website', 'genres', 'seeking_venue', 'seeking_description',
+  ],
+  'shows': ['id', 'venue_id', 'artist_id', 'start_time'],
+}
+
+#----------------------------------------------------------------------------#
+# Import.
+#----------------------------------------------------------------------------#
+
+def read_records(source, fmt):
+  """Yield (line number, record) pairs from an NDJSON or CSV stream.
+
+  A record that cannot be parsed is yielded as the RecordError instead.
+  """
+  if fmt == 'csv':
+    reader = csv.DictReader(source)
+    for record in reader:
+      yield reader.line_num, record
+    return
+
+  for line_no, line in enumerate(source, 1):
+    if not line.strip():
+      continue
+    try:
+      record = json.loads(line)
+    except ValueError as e:
+      yield line_no, RecordError('invalid JSON: {}'.format(e))
+      continue
+    if not isinstance(record, dict):
+      record = RecordError('expected a JSON object')
+    yield line_no, record
+
+
+def _insert(model, rows):
+  """Insert rows with one executemany per distinct set of columns."""
+  with_id = [row for row in rows if 'id' in row]
+  without_id = [row for row in rows if 'id' not in row]
+  for group in (with_id, without_id):
+    if group:
+      db.session.execute(model.__table__.insert(), group)
+
+
+def _write(kind, rows):
+  """Insert rows of kind and count them if they are shows."""
+  _insert(KINDS[kind][0], rows)
+  if kind == 'shows':
+    counters.record_shows_created(
+      (row['venue_id'], row['artist_id'], row['start_time']) for row in rows
+    )
+
+
+def _database_error(error):
+  return str(error.orig).strip().splitlines()[0]
+
+
+def sync_id_sequence(model):
+  """Move the id sequence past ids that were inserted explicitly."""
+  table = model.__tablename__
+  db.session.execute(
+    "SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+    "coalesce((SELECT max(id) FROM \"{table}\"), 1))".format(table=table)
+  )
+
+
+def import_batch(kind, batch, report):
+  """Validate and insert one batch of (line number, record) pairs.
+
+  Calls report(line number, message) for every rejected record and
+  returns the number of records inserted. If the database rejects the
+  batch, for instance over a duplicate explicit id, its rows are retried
+  one by one in savepoints so only the offending lines are rejected.
+  """
+  clean = KINDS[kind][1]
+  rows = []
+  for line_no, record in batch:
+    try:
+      if isinstance(record, RecordError):
+        raise record
+      rows.append((line_no, clean(record)))
+    except RecordError as e:
+      report(line_no, str(e))
+
+  if kind == 'shows' and rows:
+    missing_venues, missing_artists = missing_references(
+      [row for _, row in rows]
+    )
+    # The primary key of the partitioned Show table is (id, start_time),
+    # so the database accepts a second show with an id at another time.
+    taken = existing_ids(Show, {row['id'] for _, row in rows if 'id' in row})
+    valid = []
+    for line_no, row in rows:
+      if row['venue_id'] in missing_venues:
+        report(line_no, 'venue {} does not exist'.format(row['venue_id']))
+      elif row['artist_id'] in missing_artists:
+        report(line_no, 'artist {} does not exist'.format(row['artist_id']))
+      elif 'id' in row and row['id'] in taken:
+        report(line_no, 'show {} already exists'.format(row['id']))
+      else:
+        valid.append((line_no, row))
+        taken.add(row.get('id'))
+    rows = valid
+
+  if not rows:
+    return 0
+  try:
+    _write(kind, [row for _, row in rows])
+    db.session.commit()
+    return len(rows)
+  except DBAPIError:
+    db.session.rollback()
+  except Exception:
+    db.session.rollback()
+    raise
+
+  imported = 0
+  try:
+    for line_no, row in rows:
+      try:
+        with db.session.begin_nested():
+          _write(kind, [row])
+      except DBAPIError as e:
+        report(line_no, _database_error(e))
+      else:
+        imported += 1
+    db.session.commit()
+  except Exception:
+    db.session.rollback()
+    raise
+  return imported
+
+
+def import_records(kind, records, batch_size=DEFAULT_BATCH_SIZE, report=None):
+  """Import (line number, record) pairs in batches.
+
+  Returns (imported, rejected) counts.
+  """
+  rejected = []
+
+  def reject(line_no, message):
+    rejected.append(line_no)
+    if report:
+      report(line_no, message)
+
+  imported = 0
+  explicit_ids = False
+  records = iter(records)
+  while True:
+    batch = list(islice(records, batch_size))
+    if not batch:
+      break
+    explicit_ids = explicit_ids or any(
+      isinstance(record, dict) and record.get('id') not in (None, '')
+      for _, record in batch
+    )
+    imported += import_batch(kind, batch, reject)
+
+  if explicit_ids:
+    sync_id_sequence(KINDS[kind][0])
+    db.session.commit()
+  if imported and kind != 'shows':
+    matchmaking.rebuild(kind[:-1])
+  return imported, len(rejected)
+
+#----------------------------------------------------------------------------#
+# Export.
+#----------------------------------------------------------------------------#
+
+def export_rows(kind, batch_size=DEFAULT_BATCH_SIZE):
+  """Yield every row of kind as a dict, in id order, without buffering."""
+  model = KINDS[kind][0]
+  columns = [getattr(model, name) for name in EXPORT_COLUMNS[kind]]
+  query = db.session.query(*columns).order_by(model.id).execution_options(
+    stream_results=True
+  ).yield_per(batch_size)
+  for row in query:
+    yield row._asdict()
+
+
+def _serializable(value):
+  return value.isoformat() if isinstance(value, datetime) else value
+
+
+def write_records(kind, rows, out, fmt):
+  """Write export rows to out as NDJSON or CSV; return the row count."""
+  count = 0
+  if fmt == 'csv':
+    writer = csv.DictWriter(out, fieldnames=EXPORT_COLUMNS[kind])
+    writer.writeheader()
+    for row in rows:
+      if 'genres' in row:
+        row['genres'] = GENRE_SEPARATOR.join(row['genres'] or [])
+      writer.writerow({key: _serializable(value) for key, value in row.items()})
+      count += 1
+    return count
+
+  for row in rows:
+    out.write(json.dumps(
+      {key: _serializable(value) for key, value in row.items()}
+    ))
+    out.write('\n')
+    count += 1
+  return count
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+def _format_for(path, fmt):
+  if fmt:
+    return fmt
+  return 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+
+@data_cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('source', type=click.File('r'))
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']),
+              help='Input format; guessed from the file name by default.')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True,
+              help='Records validated and committed per transaction.')
+def import_command(kind, source, fmt, batch_size):
+  """Import venues, artists or shows from an NDJSON or CSV file."""
+  fmt = _format_for(source.name, fmt)
+
+  def report(line_no, message):
+    click.echo('line {}: {}'.format(line_no, message), err=True)
+
+  imported, rejected = import_records(
+    kind, read_records(source, fmt), batch_size, report
+  )
+  click.echo('Imported {} {}, rejected {}.'.format(imported, kind, rejected))
+  if rejected:
+    sys.exit(1)
+
+
+@data_cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('destination', type=click.File('w'), default='-')
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']),
+              help='Output format; guessed from the file name by default.')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True,
+              help='Rows fetched from the server-side cursor at a time.')
+def export_command(kind, destination, fmt, batch_size):
+  """Export venues, artists or shows to an NDJSON or CSV file."""
+  fmt = _format_for(destination.name, fmt)
+  count = write_records(
+    kind, export_rows(kind, batch_size), destination, fmt
+  )
+  click.echo('Exported {} {}.'.format(count, kind), err=True)
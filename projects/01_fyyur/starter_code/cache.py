@@ -0,0 +1,203 @@
+"""Tag-invalidated, size-bounded response cache for Fyyur's read pages.
+
+GET views decorated with cached() store their rendered responses under
+the request path and locale, together with the tags of the records they
+show (``venues``, ``venue:3``, ...). The write handlers invalidate
+exactly those tags after committing, and least-recently-used entries are
+evicted once the entry or byte budget is exceeded. Entries also expire after
+RESPONSE_CACHE_TTL seconds, which bounds staleness for changes made
+outside this process (other workers, CLI imports, counter rollovers).
+"""
+import threading
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+from functools import wraps
+
+from flask import current_app, g, request, session
+
+from formatting import request_locale
+from negotiation import representation
+
+CacheEntry = namedtuple(
+  'CacheEntry', ['status', 'headers', 'body', 'tags', 'expires_at']
+)
+
+# Headers describing one particular response rather than the resource.
+UNCACHED_HEADERS = frozenset(['X-Cache', 'Date', 'Set-Cookie'])
+
+
+class ResponseCache(object):
+  """An LRU map from cache keys to rendered responses, indexed by tag."""
+
+  def __init__(self):
+    self._entries = OrderedDict()
+    self._keys_by_tag = defaultdict(set)
+    self._lock = threading.Lock()
+    self.enabled = False
+    self.max_entries = 1024
+    self.max_bytes = 64 * 1024 * 1024
+    self.ttl = 60
+    self.size = 0
+    # Bumped on every invalidation so a response rendered from data that
+    # was invalidated while it rendered is not stored.
+    self.generation = 0
+    self.hits = self.misses = self.evictions = self.invalidations = 0
+
+  def init_app(self, app):
+    self.enabled = app.config['RESPONSE_CACHE_ENABLED']
+    self.max_entries = app.config['RESPONSE_CACHE_MAX_ENTRIES']
+    self.max_bytes = app.config['RESPONSE_CACHE_MAX_BYTES']
+    self.ttl = app.config['RESPONSE_CACHE_TTL']
+
+  def get(self, key):
+    """Return the live entry stored under key, or None."""
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and entry.expires_at <= time.monotonic():
+        self._remove(key)
+        entry = None
+      if entry is None:
+        self.misses += 1
+        return None
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return entry
+
+  def set(self, key, status, headers, body, tags, generation):
+    """Store a response unless its tags were invalidated since generation."""
+    if len(body) > self.max_bytes:
+      return
+    with self._lock:
+      if generation != self.generation:
+        return
+      if key in self._entries:
+        self._remove(key)
+      self._entries[key] = CacheEntry(
+        status, headers, body, frozenset(tags), time.monotonic() + self.ttl
+      )
+      self.size += len(body)
+      for tag in tags:
+        self._keys_by_tag[tag].add(key)
+      while (len(self._entries) > self.max_entries
+             or self.size > self.max_bytes):
+        self._remove(next(iter(self._entries)))
+        self.evictions += 1
+
+  def invalidate(self, *tags):
+    """Drop every entry carrying any of tags."""
+    with self._lock:
+      self.generation += 1
+      for tag in tags:
+        for key in list(self._keys_by_tag.get(tag, ())):
+          self._remove(key)
+          self.invalidations += 1
+
+  def clear(self):
+    with self._lock:
+      self.generation += 1
+      self._entries.clear()
+      self._keys_by_tag.clear()
+      self.size = 0
+
+  def stats(self):
+    with self._lock:
+      lookups = self.hits + self.misses
+      return {
+        "enabled": self.enabled,
+        "entries": len(self._entries),
+        "bytes": self.size,
+        "max_entries": self.max_entries,
+        "max_bytes": self.max_bytes,
+        "hits": self.hits,
+        "misses": self.misses,
+        "hit_rate": float(self.hits) / lookups if lookups else None,
+        "evictions": self.evictions,
+        "invalidations": self.invalidations,
+        "tags": len(self._keys_by_tag),
+      }
+
+  def _remove(self, key):
+    entry = self._entries.pop(key)
+    self.size -= len(entry.body)
+    for tag in entry.tags:
+      keys = self._keys_by_tag[tag]
+      keys.discard(key)
+      if not keys:
+        del self._keys_by_tag[tag]
+
+
+response_cache = ResponseCache()
+
+
+def cache_key():
+  """Return the key the current request's response is cached under."""
+  return request_locale(), representation(), request.full_path
+
+
+def tag(*tags):
+  """Add tags to the response being rendered by a cached() view."""
+  if 'cache_tags' in g:
+    g.cache_tags.update(tags)
+
+
+def _store(key, response, generation):
+  headers = [
+    (name, value) for name, value in response.headers
+    if name not in UNCACHED_HEADERS
+  ]
+  tags = g.cache_tags
+  if not response.is_streamed:
+    response_cache.set(
+      key, response.status_code, headers, response.get_data(), tags,
+      generation
+    )
+    return response
+
+  # Keep streaming to the client and store the body once it is complete.
+  chunks = response.response
+  charset = response.charset
+
+  def tee():
+    body = []
+    for chunk in chunks:
+      body.append(chunk.encode(charset) if isinstance(chunk, str) else chunk)
+      yield chunk
+    response_cache.set(
+      key, response.status_code, headers, b''.join(body), tags, generation
+    )
+
+  response.response = tee()
+  return response
+
+
+def cached(*tags):
+  """Serve a GET view from the response cache, storing it under tags.
+
+  Responses are not cached while flashed messages are pending, since
+  the layout renders them into the page.
+  """
+  def decorator(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      if (not response_cache.enabled or request.method != 'GET'
+          or session.get('_flashes')):
+        return view(*args, **kwargs)
+
+      key = cache_key()
+      entry = response_cache.get(key)
+      if entry is not None:
+        response = current_app.response_class(
+          entry.body, status=entry.status, headers=entry.headers
+        )
+        response.headers['X-Cache'] = 'HIT'
+        return response.make_conditional(request)
+
+      generation = response_cache.generation
+      g.cache_tags = set(tags)
+      response = current_app.make_response(view(*args, **kwargs))
+      if response.status_code == 200 and 'Set-Cookie' not in response.headers:
+        response = _store(key, response, generation)
+      response.headers['X-Cache'] = 'MISS'
+      return response
+    return wrapper
+  return decorator
@@ -0,0 +1,195 @@
+"""Upcoming/past show counters stored on the Venue and Artist rows.
+
+A show is counted as upcoming while its start_time is later than the
+watermark kept in ShowCounterWatermark, and as past otherwise. Writes
+adjust the counters of the venue and artist they touch, and roll_over()
+moves the shows that started since the last watermark from the upcoming
+to the past column, so readers never have to load a show to count it.
+"""
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, func
+
+from models import db, Artist, Venue, Show, ShowCounterWatermark
+from routing import primary
+
+WATERMARK_ID = 1
+
+counters_cli = AppGroup('counters', help='Maintain venue/artist show counters.')
+
+_next_rollover = 0.0
+
+
+def _watermark(lock=False, read=False):
+  """Return the watermark row, optionally locking it for the transaction."""
+  query = ShowCounterWatermark.query.filter_by(id=WATERMARK_ID)
+  if lock:
+    query = query.with_for_update(read=read)
+  return query.one()
+
+
+def _adjust(shows, delta):
+  """Add delta to the counter columns each show falls into.
+
+  shows is an iterable of (venue_id, artist_id, start_time) triples; the
+  changes are applied with one executemany UPDATE per table.
+  """
+  watermark = _watermark(lock=True, read=True)
+  deltas = {
+    Venue: defaultdict(lambda: [0, 0]),
+    Artist: defaultdict(lambda: [0, 0]),
+  }
+  for venue_id, artist_id, start_time in shows:
+    column = 0 if start_time > watermark.rolled_at else 1
+    deltas[Venue][int(venue_id)][column] += delta
+    deltas[Artist][int(artist_id)][column] += delta
+
+  for model, per_entity in deltas.items():
+    if not per_entity:
+      continue
+    db.session.execute(
+      model.__table__.update().where(
+        model.id == bindparam('entity_id')
+      ).values(
+        upcoming_shows_count=model.upcoming_shows_count + bindparam('upcoming'),
+        past_shows_count=model.past_shows_count + bindparam('past'),
+      ),
+      [
+        {'entity_id': entity_id, 'upcoming': upcoming, 'past': past}
+        # Sorted so concurrent writers lock rows in the same order.
+        for entity_id, (upcoming, past) in sorted(per_entity.items())
+      ]
+    )
+
+
+def record_show_created(show):
+  """Count a new show. Call before the session that adds it commits."""
+  _adjust([(show.venue_id, show.artist_id, show.start_time)], 1)
+
+
+def record_shows_created(shows):
+  """Count many new (venue_id, artist_id, start_time) shows at once."""
+  _adjust(shows, 1)
+
+
+def forget_venue_shows(venue_id):
+  """Uncount a venue's shows from their artists before the venue is deleted."""
+  watermark = _watermark(lock=True, read=True)
+  per_artist = db.session.query(
+    Show.artist_id.label('artist_id'),
+    func.count(Show.id).filter(
+      Show.start_time > watermark.rolled_at
+    ).label('upcoming'),
+    func.count(Show.id).filter(
+      Show.start_time <= watermark.rolled_at
+    ).label('past'),
+  ).filter(Show.venue_id == venue_id).group_by(Show.artist_id).subquery()
+
+  db.session.execute(
+    Artist.__table__.update().where(
+      Artist.id == per_artist.c.artist_id
+    ).values(
+      upcoming_shows_count=Artist.upcoming_shows_count - per_artist.c.upcoming,
+      past_shows_count=Artist.past_shows_count - per_artist.c.past,
+    )
+  )
+
+
+def _move_started_shows(model, key, since, until):
+  """Shift shows that started in (since, until] from upcoming to past."""
+  started = db.session.query(
+    key.label('entity_id'),
+    func.count(Show.id).label('started'),
+  ).filter(
+    Show.start_time > since,
+    Show.start_time <= until,
+  ).group_by(key).subquery()
+
+  db.session.execute(
+    model.__table__.update().where(
+      model.id == started.c.entity_id
+    ).values(
+      upcoming_shows_count=model.upcoming_shows_count - started.c.started,
+      past_shows_count=model.past_shows_count + started.c.started,
+    )
+  )
+
+
+def roll_over(now=None):
+  """Advance the watermark to now, moving shows that have since started."""
+  now = now or datetime.now()
+  # Listing pages roll over while reading from a replica.
+  with primary():
+    watermark = _watermark(lock=True)
+    if now > watermark.rolled_at:
+      _move_started_shows(Venue, Show.venue_id, watermark.rolled_at, now)
+      _move_started_shows(Artist, Show.artist_id, watermark.rolled_at, now)
+      watermark.rolled_at = now
+    db.session.commit()
+
+
+def maybe_roll_over():
+  """Roll counters over at most once per COUNTER_ROLLOVER_INTERVAL seconds."""
+  global _next_rollover
+  if time.monotonic() < _next_rollover:
+    return
+  _next_rollover = (
+    time.monotonic() + current_app.config['COUNTER_ROLLOVER_INTERVAL']
+  )
+  roll_over()
+
+
+def _recount(model, key, now):
+  """Recompute every counter of model from the Show table."""
+  counts = db.session.query(
+    key.label('entity_id'),
+    func.count(Show.id).filter(Show.start_time > now).label('upcoming'),
+    func.count(Show.id).filter(Show.start_time <= now).label('past'),
+  ).group_by(key).subquery()
+
+  model.query.update(
+    {model.upcoming_shows_count: 0, model.past_shows_count: 0},
+    synchronize_session=False
+  )
+  db.session.execute(
+    model.__table__.update().where(
+      model.id == counts.c.entity_id
+    ).values(
+      upcoming_shows_count=counts.c.upcoming,
+      past_shows_count=counts.c.past,
+    )
+  )
+
+
+def rebuild(now=None):
+  """Recompute all counters from scratch and reset the watermark."""
+  now = now or datetime.now()
+  watermark = ShowCounterWatermark.query.filter_by(
+    id=WATERMARK_ID
+  ).with_for_update().first()
+  if watermark is None:
+    watermark = ShowCounterWatermark(id=WATERMARK_ID)
+    db.session.add(watermark)
+  _recount(Venue, Show.venue_id, now)
+  _recount(Artist, Show.artist_id, now)
+  watermark.rolled_at = now
+  db.session.commit()
+
+
+@counters_cli.command('rollover')
+def rollover_command():
+  """Move shows that have started since the last run into the past counts."""
+  roll_over()
+  click.echo('Show counters rolled over.')
+
+
+@counters_cli.command('rebuild')
+def rebuild_command():
+  """Recount every venue's and artist's shows."""
+  rebuild()
+  click.echo('Show counters rebuilt.')
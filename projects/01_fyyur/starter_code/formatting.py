@@ -0,0 +1,72 @@
+"""Memoized, locale-aware datetime formatting for the Fyyur templates.
+
+Babel's format_datetime() resolves the locale, normalises time zones
+and looks its pattern up again on every call, and the old filter also
+round-tripped each value through dateutil's parser. Here the compiled
+pattern and Locale are cached per (format, locale), datetime values are
+used as they are, and format_datetimes() formats a whole list against
+one compiled pattern. The show lists of the venue, artist and show
+search pages are formatted that way through the |with_datetimes filter.
+"""
+from datetime import date, datetime
+from functools import lru_cache
+
+import dateutil.parser
+from babel import Locale
+from babel.dates import parse_pattern
+from flask import current_app, has_request_context, request
+
+# Shorthand formats used by the templates' |datetime filter.
+NAMED_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=128)
+def compiled_format(format, locale):
+  """Return the (DateTimePattern, Locale) pair for a format and locale."""
+  pattern = NAMED_FORMATS.get(format, format)
+  return parse_pattern(pattern), Locale.parse(locale)
+
+
+def request_locale():
+  """Return the best supported locale for the current request."""
+  if not has_request_context():
+    return current_app.config['BABEL_DEFAULT_LOCALE']
+  return request.accept_languages.best_match(
+    current_app.config['SUPPORTED_LOCALES'],
+    default=current_app.config['BABEL_DEFAULT_LOCALE'],
+  )
+
+
+def to_datetime(value):
+  """Return value as a datetime, parsing it only if it is not one."""
+  if isinstance(value, datetime):
+    return value
+  if isinstance(value, date):
+    return datetime(value.year, value.month, value.day)
+  return dateutil.parser.parse(str(value))
+
+
+def format_datetime(value, format='medium', locale=None):
+  """Format one date, datetime or date string."""
+  pattern, locale = compiled_format(format, locale or request_locale())
+  return pattern.apply(to_datetime(value), locale)
+
+
+def format_datetimes(values, format='medium', locale=None):
+  """Format many values with a single pattern and locale lookup."""
+  pattern, locale = compiled_format(format, locale or request_locale())
+  return [pattern.apply(to_datetime(value), locale) for value in values]
+
+
+def with_datetimes(rows, format='medium', field='start_time'):
+  """Pair each row dict with its field formatted, the rows in one batch.
+
+  The |with_datetimes template filter, for loops over a list of shows.
+  """
+  rows = list(rows)
+  return list(zip(rows, format_datetimes(
+    [row[field] for row in rows], format
+  )))
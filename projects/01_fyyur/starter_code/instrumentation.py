@@ -0,0 +1,175 @@
+"""Opt-in per-request SQL instrumentation and N+1 detection.
+
+When SQL_INSTRUMENTATION is enabled, SQLAlchemy engine events time
+every statement run while a request is being handled. At the end of the
+request the query count, total database time and any statement shape
+repeated at least SQL_N_PLUS_ONE_THRESHOLD times (the usual signature
+of a lazy load inside a loop) are written to the app logger, and folded
+into per-route totals served by the /admin/sql endpoint.
+"""
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Bind parameters, lists of them (expanded IN clauses) and literals are
+# folded so that statements differing only in values share a shape.
+_PARAMS = re.compile(r"%\(\w+\)s(\s*,\s*%\(\w+\)s)*|\?(\s*,\s*\?)*")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_SPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+  """Return statement with its values folded into placeholders."""
+  shape = _PARAMS.sub('?', statement)
+  shape = _LITERALS.sub('?', shape)
+  return _SPACE.sub(' ', shape).strip()
+
+
+class RequestStats(object):
+  """Statements seen while handling one request."""
+
+  def __init__(self):
+    self.count = 0
+    self.duration = 0.0
+    self.shapes = Counter()
+
+  def record(self, statement, duration):
+    self.count += 1
+    self.duration += duration
+    self.shapes[statement_shape(statement)] += 1
+
+  def repeated(self, threshold):
+    """Return the (shape, count) pairs run at least threshold times."""
+    return [
+      (shape, count) for shape, count in self.shapes.most_common()
+      if count >= threshold
+    ]
+
+
+class RouteStats(object):
+  """Totals over every instrumented request to one endpoint."""
+
+  def __init__(self):
+    self.requests = 0
+    self.queries = 0
+    self.duration = 0.0
+    self.max_queries = 0
+    self.n_plus_one = 0
+    self.suspects = Counter()
+
+  def add(self, stats, repeated):
+    self.requests += 1
+    self.queries += stats.count
+    self.duration += stats.duration
+    self.max_queries = max(self.max_queries, stats.count)
+    if repeated:
+      self.n_plus_one += 1
+      for shape, count in repeated:
+        self.suspects[shape] = max(self.suspects[shape], count)
+
+  def as_dict(self):
+    return {
+      "requests": self.requests,
+      "queries": self.queries,
+      "avg_queries": float(self.queries) / self.requests,
+      "max_queries": self.max_queries,
+      "db_time_ms": self.duration * 1000,
+      "avg_db_time_ms": self.duration * 1000 / self.requests,
+      "n_plus_one_requests": self.n_plus_one,
+      "n_plus_one_suspects": [
+        {"statement": shape, "max_repeats": count}
+        for shape, count in self.suspects.most_common(5)
+      ],
+    }
+
+
+class SQLInstrumentation(object):
+  """Collects RequestStats per request and RouteStats per endpoint."""
+
+  def __init__(self):
+    self.enabled = False
+    self.threshold = 5
+    self._routes = defaultdict(RouteStats)
+    self._lock = threading.Lock()
+    self._logger = None
+
+  def init_app(self, app):
+    self.enabled = app.config['SQL_INSTRUMENTATION']
+    self.threshold = app.config['SQL_N_PLUS_ONE_THRESHOLD']
+    self._logger = app.logger
+    if not self.enabled:
+      return
+    # Listening on the Engine class covers every engine the app creates.
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+    # A failed statement gets no after_cursor_execute; close its timer.
+    event.listen(Engine, 'handle_error', self._handle_error)
+    app.before_request(self._start)
+    # Teardown, unlike after_request, runs after a streamed body is sent.
+    app.teardown_request(self._finish)
+
+  def _start(self):
+    g.sql_stats = RequestStats()
+
+  def _after_cursor_execute(self, conn, cursor, statement, parameters,
+                            context, executemany):
+    self._record(conn, statement)
+
+  def _handle_error(self, exception_context):
+    conn = exception_context.connection
+    if conn is not None and exception_context.statement is not None:
+      self._record(conn, exception_context.statement)
+
+  def _record(self, conn, statement):
+    started = conn.info.get('query_started', [])
+    if not started:
+      return
+    duration = time.perf_counter() - started.pop()
+    if has_request_context() and 'sql_stats' in g:
+      g.sql_stats.record(statement, duration)
+
+  def _finish(self, exc=None):
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+      return
+    repeated = stats.repeated(self.threshold)
+    with self._lock:
+      self._routes[request.endpoint].add(stats, repeated)
+
+    message = '%s %s: %d queries, %.1f ms in database'
+    args = [request.method, request.path, stats.count, stats.duration * 1000]
+    if repeated:
+      message += '; possible N+1: %s'
+      args.append('; '.join(
+        '{}x {}'.format(count, shape) for shape, count in repeated
+      ))
+      self._logger.warning(message, *args)
+    else:
+      self._logger.info(message, *args)
+
+  def worst_routes(self, limit=10, key='avg_queries'):
+    """Return per-route totals, worst first by key."""
+    with self._lock:
+      routes = [
+        dict(stats.as_dict(), endpoint=endpoint)
+        for endpoint, stats in self._routes.items()
+      ]
+    routes.sort(key=lambda route: route[key], reverse=True)
+    return routes[:limit]
+
+  def reset(self):
+    with self._lock:
+      self._routes.clear()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+  conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+sql_instrumentation = SQLInstrumentation()
@@ -0,0 +1,110 @@
+"""Venue/artist suggestions served from a precomputed inverted index.
+
+MatchIndex holds one row per genre of every venue seeking talent and
+every artist seeking a venue, keyed by (kind, state, genre). Suggesting
+artists for a venue is then one range scan over the venue's state and
+genres, ranked by the number of genres shared and a matching city,
+instead of a cross join of venues and artists.
+
+Write paths call reindex() with the ids they created or changed, inside
+their own transaction; bulk imports rebuild a whole kind at once.
+"""
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, func, literal
+
+from models import db, Artist, MatchIndex, Venue
+
+# kind -> (model, whether the entity is looking for the other kind).
+SEEKERS = {
+  'venue': (Venue, Venue.seeking_talent),
+  'artist': (Artist, Artist.seeking_venue),
+}
+
+matchmaking_cli = AppGroup(
+  'matchmaking', help='Maintain the venue/artist suggestion index.'
+)
+
+
+def _postings(kind, condition=None):
+  """Return an INSERT ... SELECT of the index rows of kind's seekers."""
+  model, seeking = SEEKERS[kind]
+  genre = func.unnest(model.genres).label('genre')
+  select = db.session.query(
+    literal(kind).label('kind'),
+    model.state,
+    genre,
+    model.id,
+    model.city,
+  ).filter(seeking.is_(True))
+  if condition is not None:
+    select = select.filter(condition)
+  return MatchIndex.__table__.insert().from_select(
+    ['kind', 'state', 'genre', 'entity_id', 'city'], select.distinct()
+  )
+
+
+def reindex(kind, ids):
+  """Bring the index rows of the given venues or artists up to date.
+
+  Flushes the session first, so pending creates, edits and deletes are
+  what gets indexed. Call inside the transaction making the change.
+  """
+  ids = list(ids)
+  if not ids:
+    return
+  db.session.flush()
+  db.session.execute(MatchIndex.__table__.delete().where(and_(
+    MatchIndex.kind == kind, MatchIndex.entity_id.in_(ids)
+  )))
+  db.session.execute(_postings(kind, SEEKERS[kind][0].id.in_(ids)))
+
+
+def rebuild(kind=None):
+  """Recompute the index rows of one kind, or of both."""
+  for name in [kind] if kind else sorted(SEEKERS):
+    db.session.execute(
+      MatchIndex.__table__.delete().where(MatchIndex.kind == name)
+    )
+    db.session.execute(_postings(name))
+  db.session.commit()
+
+
+def suggestions(kind, state, city, genres, limit):
+  """Return up to limit seekers of kind sharing state and a genre.
+
+  Rows carry id, name, image_link, city and shared (the number of
+  genres in common), best matches first.
+  """
+  if not genres:
+    return []
+  model = SEEKERS[kind][0]
+  shared = func.count().label('shared')
+  same_city = func.bool_or(MatchIndex.city == city).label('same_city')
+  candidates = db.session.query(
+    MatchIndex.entity_id, shared, same_city
+  ).filter(
+    MatchIndex.kind == kind,
+    MatchIndex.state == state,
+    MatchIndex.genre.in_(genres),
+  ).group_by(MatchIndex.entity_id).order_by(
+    shared.desc(), same_city.desc(), MatchIndex.entity_id
+  ).limit(limit).subquery()
+  return db.session.query(
+    model.id,
+    model.name,
+    model.image_link,
+    model.city,
+    candidates.c.shared,
+  ).join(candidates, model.id == candidates.c.entity_id).order_by(
+    candidates.c.shared.desc(),
+    candidates.c.same_city.desc(),
+    model.id,
+  ).all()
+
+
+@matchmaking_cli.command('rebuild')
+def rebuild_command():
+  """Recompute the suggestion index from the venues and artists."""
+  rebuild()
+  click.echo('Suggestion index rebuilt.')
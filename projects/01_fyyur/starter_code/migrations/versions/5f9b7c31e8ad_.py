@@ -0,0 +1,30 @@
+"""add GIN indexes on venue and artist genres
+
+Revision ID: 5f9b7c31e8ad
+Revises: e4d83a0c61f2
+Create Date: 2021-02-22 16:05:12.734590
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f9b7c31e8ad'
+down_revision = 'e4d83a0c61f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_Venue_genres', 'Venue', ['genres'], postgresql_using='gin'
+    )
+    op.create_index(
+        'ix_Artist_genres', 'Artist', ['genres'], postgresql_using='gin'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_Artist_genres', table_name='Artist')
+    op.drop_index('ix_Venue_genres', table_name='Venue')
@@ -0,0 +1,58 @@
+"""add upcoming/past show counters to venues and artists
+
+Revision ID: 7a1c2e9d4b60
+Revises: 3ce618549dc5
+Create Date: 2021-02-01 10:12:41.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a1c2e9d4b60'
+down_revision = '3ce618549dc5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column(
+            'upcoming_shows_count', sa.Integer(), nullable=False,
+            server_default='0'
+        ))
+        op.add_column(table, sa.Column(
+            'past_shows_count', sa.Integer(), nullable=False,
+            server_default='0'
+        ))
+    op.create_table('ShowCounterWatermark',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # Backfill the counters from the existing shows.
+    op.execute('INSERT INTO "ShowCounterWatermark" (id, rolled_at) '
+               'VALUES (1, LOCALTIMESTAMP)')
+    for table, key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.execute('''
+            UPDATE "{table}" SET
+              upcoming_shows_count = counts.upcoming,
+              past_shows_count = counts.past
+            FROM (
+              SELECT {key} AS entity_id,
+                count(*) FILTER (WHERE start_time > w.rolled_at) AS upcoming,
+                count(*) FILTER (WHERE start_time <= w.rolled_at) AS past
+              FROM "Show", "ShowCounterWatermark" w
+              GROUP BY {key}
+            ) AS counts
+            WHERE "{table}".id = counts.entity_id
+        '''.format(table=table, key=key))
+
+
+def downgrade():
+    op.drop_table('ShowCounterWatermark')
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,30 @@
+"""add composite (entity, start_time) indexes on shows
+
+Revision ID: a9e1f6d24c08
+Revises: 5f9b7c31e8ad
+Create Date: 2021-03-01 11:48:30.215673
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9e1f6d24c08'
+down_revision = '5f9b7c31e8ad'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time']
+    )
+    op.create_index(
+        'ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
@@ -0,0 +1,33 @@
+"""add trigram indexes for venue and artist name search
+
+Revision ID: b52f0d8e3a17
+Revises: 7a1c2e9d4b60
+Create Date: 2021-02-08 14:37:05.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b52f0d8e3a17'
+down_revision = '7a1c2e9d4b60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index(
+        'ix_Venue_name_trgm', 'Venue', ['name'], postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'}
+    )
+    op.create_index(
+        'ix_Artist_name_trgm', 'Artist', ['name'], postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'}
+    )
+
+
+def downgrade():
+    op.drop_index('ix_Artist_name_trgm', table_name='Artist')
+    op.drop_index('ix_Venue_name_trgm', table_name='Venue')
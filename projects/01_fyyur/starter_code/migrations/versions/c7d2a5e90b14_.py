@@ -0,0 +1,110 @@
+"""partition shows by month of start_time
+
+A primary key of a partitioned table has to include the partition key,
+so the key of "Show" becomes (id, start_time) and the database no longer
+rejects two shows with the same id. Ids drawn from "Show_id_seq" stay
+unique; explicit show ids, which only the bulk importer accepts, are
+checked against the existing shows before they are inserted, and batch
+creation moves the sequence past any it would collide with. Concurrent
+imports of the same explicit id are not guarded against.
+
+Revision ID: c7d2a5e90b14
+Revises: a9e1f6d24c08
+Create Date: 2021-03-08 10:12:44.508921
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2a5e90b14'
+down_revision = 'a9e1f6d24c08'
+branch_labels = None
+depends_on = None
+
+# Months of empty partitions created past the latest show or today.
+MONTHS_AHEAD = 12
+
+INDEXES = [
+    ('ix_Show_start_time_id', 'start_time, id'),
+    ('ix_Show_venue_id_start_time', 'venue_id, start_time'),
+    ('ix_Show_artist_id_start_time', 'artist_id, start_time'),
+]
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def _month(value):
+    return datetime(value.year, value.month, 1)
+
+
+def _move_into(table):
+    """Recreate "Show" as table and copy the rows of "Show_old" into it."""
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_old"')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+    op.execute('ALTER TABLE "Show_old" DROP CONSTRAINT "Show_pkey"')
+    for name, _ in INDEXES:
+        op.execute('DROP INDEX "{}"'.format(name))
+    op.execute(table)
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+
+
+def _copy_rows_and_index():
+    op.execute(
+        'INSERT INTO "Show" (id, start_time, artist_id, venue_id) '
+        'SELECT id, start_time, artist_id, venue_id FROM "Show_old"'
+    )
+    op.execute('DROP TABLE "Show_old"')
+    for name, columns in INDEXES:
+        op.execute('CREATE INDEX "{}" ON "Show" ({})'.format(name, columns))
+
+
+def upgrade():
+    bind = op.get_bind()
+    first, last = bind.execute(
+        'SELECT min(start_time), max(start_time) FROM "Show"'
+    ).first()
+    today = _month(datetime.now())
+    first = _month(first) if first else today
+    last = max(_month(last) if last else today, today)
+
+    _move_into(
+        'CREATE TABLE "Show" ('
+        ' id integer NOT NULL DEFAULT nextval(\'"Show_id_seq"\'::regclass),'
+        ' start_time timestamp without time zone NOT NULL,'
+        ' artist_id integer NOT NULL REFERENCES "Artist" (id),'
+        ' venue_id integer NOT NULL REFERENCES "Venue" (id),'
+        ' CONSTRAINT "Show_pkey" PRIMARY KEY (id, start_time)'
+        ') PARTITION BY RANGE (start_time)'
+    )
+    month = first
+    while month <= _add_months(last, MONTHS_AHEAD):
+        op.execute(
+            'CREATE TABLE "Show_{:%Y_%m}" PARTITION OF "Show" '
+            "FOR VALUES FROM ('{:%Y-%m-%d}') TO ('{:%Y-%m-%d}')".format(
+                month, month, _add_months(month, 1)
+            )
+        )
+        month = _add_months(month, 1)
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT')
+    _copy_rows_and_index()
+
+
+def downgrade():
+    _move_into(
+        'CREATE TABLE "Show" ('
+        ' id integer NOT NULL DEFAULT nextval(\'"Show_id_seq"\'::regclass),'
+        ' start_time timestamp without time zone NOT NULL,'
+        ' artist_id integer NOT NULL REFERENCES "Artist" (id),'
+        ' venue_id integer NOT NULL REFERENCES "Venue" (id),'
+        ' CONSTRAINT "Show_pkey" PRIMARY KEY (id)'
+        ')'
+    )
+    # Dropping the partitioned table drops its partitions with it.
+    _copy_rows_and_index()
@@ -0,0 +1,45 @@
+"""add the venue/artist matchmaking index
+
+Revision ID: d3f8b61c2a97
+Revises: c7d2a5e90b14
+Create Date: 2021-03-15 09:41:27.730154
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f8b61c2a97'
+down_revision = 'c7d2a5e90b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('MatchIndex',
+    sa.Column('kind', sa.String(length=6), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('genre', sa.String(length=20), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'state', 'genre', 'entity_id')
+    )
+    op.create_index(
+        'ix_MatchIndex_kind_entity_id', 'MatchIndex', ['kind', 'entity_id']
+    )
+
+    # Backfill from the venues and artists currently seeking.
+    for kind, table, seeking in (('venue', 'Venue', 'seeking_talent'),
+                                 ('artist', 'Artist', 'seeking_venue')):
+        op.execute('''
+            INSERT INTO "MatchIndex" (kind, state, genre, entity_id, city)
+            SELECT DISTINCT '{kind}', state, unnest(genres), id, city
+            FROM "{table}"
+            WHERE {seeking}
+        '''.format(kind=kind, table=table, seeking=seeking))
+
+
+def downgrade():
+    op.drop_index('ix_MatchIndex_kind_entity_id', table_name='MatchIndex')
+    op.drop_table('MatchIndex')
@@ -0,0 +1,28 @@
+"""add sort-key indexes for keyset pagination of listings
+
+Revision ID: e4d83a0c61f2
+Revises: b52f0d8e3a17
+Create Date: 2021-02-15 09:21:48.550317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4d83a0c61f2'
+down_revision = 'b52f0d8e3a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_Venue_city_state_id', 'Venue', ['city', 'state', 'id']
+    )
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
+    op.drop_index('ix_Venue_city_state_id', table_name='Venue')
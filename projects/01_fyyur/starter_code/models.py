@@ -1,6 +1,8 @@
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import ARRAY
 
-db = SQLAlchemy()
+from routing import RoutingSQLAlchemy
+
+db = RoutingSQLAlchemy()
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -8,6 +10,14 @@ db = SQLAlchemy()
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index(
+            'ix_Venue_name_trgm', 'name', postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'}
+        ),
+        db.Index('ix_Venue_city_state_id', 'city', 'state', 'id'),
+        db.Index('ix_Venue_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -18,31 +28,81 @@ class Venue(db.Model):
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(20)), nullable=False)
+    genres = db.Column(ARRAY(db.String(20)), nullable=False)
     seeking_talent = db.Column(db.Boolean())
     seeking_description = db.Column(db.String(500))
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship('Show', backref='venue', lazy=True, cascade="all, delete-orphan")
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index(
+            'ix_Artist_name_trgm', 'name', postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'}
+        ),
+        db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(20)), nullable=False)
+    genres = db.Column(ARRAY(db.String(20)), nullable=False)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean())
     seeking_description = db.Column(db.String(500))
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship('Show', backref='artist', lazy=True, cascade="all, delete-orphan")
 
 class Show(db.Model):
   __tablename__ = 'Show'
+  # Partitioned by month of start_time; see partitions.py. The partition
+  # key has to be part of the primary key.
+  __table_args__ = (
+    db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+    db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    {'postgresql_partition_by': 'RANGE (start_time)'},
+  )
 
-  id = db.Column(db.Integer, primary_key=True)
-  start_time = db.Column(db.DateTime, nullable=False)
+  id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+  start_time = db.Column(db.DateTime, primary_key=True)
   artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
   venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+
+# Tables made by create_all() still need somewhere to put shows.
+db.event.listen(Show.__table__, 'after_create', db.DDL(
+  'CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT'
+).execute_if(dialect='postgresql'))
+
+class ShowCounterWatermark(db.Model):
+  """Single row recording up to when show counters have been rolled over."""
+  __tablename__ = 'ShowCounterWatermark'
+
+  id = db.Column(db.Integer, primary_key=True)
+  rolled_at = db.Column(db.DateTime, nullable=False)
+
+class MatchIndex(db.Model):
+  """Inverted index of who is seeking whom, one row per genre.
+
+  Holds a row per genre of every venue seeking talent (kind 'venue') and
+  every artist seeking a venue (kind 'artist'), keyed so that looking up
+  the candidates of one kind in a state and set of genres is an index
+  range scan. Maintained by matchmaking.py.
+  """
+  __tablename__ = 'MatchIndex'
+  __table_args__ = (
+    db.Index('ix_MatchIndex_kind_entity_id', 'kind', 'entity_id'),
+  )
+
+  kind = db.Column(db.String(6), primary_key=True)
+  state = db.Column(db.String(120), primary_key=True)
+  genre = db.Column(db.String(20), primary_key=True)
+  entity_id = db.Column(db.Integer, primary_key=True)
+  city = db.Column(db.String(120), nullable=False)
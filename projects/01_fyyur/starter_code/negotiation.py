@@ -0,0 +1,108 @@
+"""Serve Fyyur's read pages as HTML or JSON, with strong ETags.
+
+A read view hands respond() the dict its template renders from. Clients
+sending ``Accept: application/json`` get that dict serialised (with
+orjson when it is installed), everyone else gets the rendered page. The
+ETag of either representation is a hash of the serialised dict, plus
+for HTML the locale, the templates it is rendered with and the asset
+manifest its static URLs come from, so a request whose If-None-Match
+still matches is answered 304 before the template is rendered at all.
+"""
+import hashlib
+import json
+import os
+from datetime import date
+
+from flask import current_app, render_template, request, session
+
+from assets import assets
+from formatting import request_locale
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+CONDITIONAL_METHODS = frozenset(['GET', 'HEAD'])
+
+_templates_digest = None
+
+
+def wants_json():
+  """Return whether the client prefers JSON to HTML."""
+  best = request.accept_mimetypes.best_match(['text/html', 'application/json'])
+  return best == 'application/json'
+
+
+def representation():
+  """Return the name of the representation the client asked for."""
+  return 'json' if wants_json() else 'html'
+
+
+def _default(value):
+  if isinstance(value, date):
+    return value.isoformat()
+  raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def dumps(value):
+  """Serialise value to JSON bytes, dates as ISO 8601 strings."""
+  if orjson is not None:
+    return orjson.dumps(value, default=_default)
+  return json.dumps(value, default=_default, separators=(',', ':')).encode()
+
+
+def templates_digest():
+  """Return a digest of every template, computed once per process."""
+  global _templates_digest
+  if _templates_digest is None:
+    digest = hashlib.sha1()
+    root = os.path.join(current_app.root_path, current_app.template_folder)
+    for folder, dirs, files in sorted(os.walk(root)):
+      dirs.sort()
+      for name in sorted(files):
+        path = os.path.join(folder, name)
+        digest.update(os.path.relpath(path, root).encode())
+        with open(path, 'rb') as template:
+          digest.update(template.read())
+    _templates_digest = digest.hexdigest()
+  return _templates_digest
+
+
+def respond(template_name, payload, **context):
+  """Render template_name with context, or send payload as JSON.
+
+  Both representations carry a strong ETag; GET and HEAD requests whose
+  If-None-Match matches it get an empty 304. HTML pages with flashed
+  messages pending are neither tagged nor answered 304, since the
+  layout renders the messages into them.
+  """
+  as_json = wants_json()
+  body = dumps(payload)
+  conditional = request.method in CONDITIONAL_METHODS and (
+    as_json or not session.get('_flashes')
+  )
+
+  etag = None
+  if conditional:
+    digest = hashlib.sha1(b'json' if as_json else b'html')
+    if not as_json:
+      digest.update(templates_digest().encode())
+      digest.update(assets.digest.encode())
+      digest.update(template_name.encode())
+      digest.update(request_locale().encode())
+    digest.update(body)
+    etag = digest.hexdigest()
+
+  if etag is not None and request.if_none_match.contains(etag):
+    response = current_app.response_class(status=304)
+  elif as_json:
+    response = current_app.response_class(body, mimetype='application/json')
+  else:
+    response = current_app.make_response(
+      render_template(template_name, **context)
+    )
+  if etag is not None:
+    response.set_etag(etag)
+  response.vary.update(['Accept', 'Accept-Language'])
+  return response
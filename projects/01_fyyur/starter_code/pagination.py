@@ -0,0 +1,153 @@
+"""Keyset (cursor) pagination for the Fyyur listing pages.
+
+A page is selected by comparing the listing's sort key with the key of
+the row just before (or after) it, so fetching any page walks the same
+index range no matter how deep into the listing it is. Cursors are the
+url-safe base64 of the boundary row's key values.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+  """Raised when a cursor from the query string cannot be decoded."""
+
+
+class Page(object):
+  """One page of a listing plus the cursors of its neighbours."""
+
+  def __init__(self, items, next_cursor=None, prev_cursor=None):
+    self.items = items
+    self.next_cursor = next_cursor
+    self.prev_cursor = prev_cursor
+
+  def __iter__(self):
+    return iter(self.items)
+
+
+class StreamedPage(Page):
+  """A forward page whose rows are fetched while it is being iterated.
+
+  The cursors are only known once iteration has finished, so templates
+  must render links to neighbouring pages after the rows.
+  """
+
+  def __init__(self, rows, keys, per_page, has_prev):
+    super(StreamedPage, self).__init__(items=None)
+    self._rows = rows
+    self._keys = keys
+    self._per_page = per_page
+    self._has_prev = has_prev
+
+  def __iter__(self):
+    last = None
+    for count, row in enumerate(self._rows):
+      if count == self._per_page:
+        self.next_cursor = encode_cursor(row_key(last, self._keys))
+        break
+      if count == 0 and self._has_prev:
+        self.prev_cursor = encode_cursor(row_key(row, self._keys))
+      last = row
+      yield row
+
+
+def encode_cursor(values):
+  """Encode a row's key values as an opaque cursor."""
+  values = [
+    value.isoformat() if isinstance(value, datetime) else value
+    for value in values
+  ]
+  raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+  return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _key_value(key, value):
+  """Convert a decoded value to the Python type of its key column."""
+  python_type = key.type.python_type
+  if python_type is datetime:
+    return datetime.fromisoformat(value)
+  # bool is an int, but no key column holds one.
+  if isinstance(value, bool) or not isinstance(value, python_type):
+    raise TypeError(value)
+  return value
+
+
+def decode_cursor(cursor, keys):
+  """Decode a cursor back into values matching the key columns.
+
+  Raises InvalidCursor unless every value has its column's Python type,
+  so a tampered cursor is a bad request rather than a database error.
+  """
+  try:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    if not isinstance(values, list) or len(values) != len(keys):
+      raise InvalidCursor(cursor)
+    return tuple(_key_value(key, value) for key, value in zip(keys, values))
+  except (binascii.Error, UnicodeError, TypeError, ValueError):
+    raise InvalidCursor(cursor)
+
+
+def row_key(row, keys):
+  """Return the key values of a result row or mapped object."""
+  return [getattr(row, key.key) for key in keys]
+
+
+def keyset_query(query, keys, after=None, before=None, per_page=50):
+  """Restrict and order query to one page, fetching one extra row.
+
+  The extra row only tells whether there is a further page in the
+  direction of travel; paginate() strips it. Rows of a ``before`` page
+  come back in descending order.
+  """
+  if before:
+    query = query.filter(tuple_(*keys) < decode_cursor(before, keys))
+    query = query.order_by(*[key.desc() for key in keys])
+  else:
+    if after:
+      query = query.filter(tuple_(*keys) > decode_cursor(after, keys))
+    query = query.order_by(*keys)
+  return query.limit(per_page + 1)
+
+
+def paginate(query, keys, after=None, before=None, per_page=50):
+  """Return the page of query that follows ``after`` or precedes ``before``.
+
+  keys are the columns the listing is ordered by; together they must be
+  unique and should be covered by one index.
+  """
+  rows = keyset_query(query, keys, after, before, per_page).all()
+  more = len(rows) > per_page
+  rows = rows[:per_page]
+  if before:
+    rows.reverse()
+    has_prev, has_next = more, True
+  else:
+    has_prev, has_next = bool(after), more
+
+  if not rows:
+    return Page(rows)
+  return Page(
+    rows,
+    next_cursor=encode_cursor(row_key(rows[-1], keys)) if has_next else None,
+    prev_cursor=encode_cursor(row_key(rows[0], keys)) if has_prev else None,
+  )
+
+
+def paginate_stream(query, keys, after=None, before=None, per_page=50,
+                    batch_size=100):
+  """Like paginate(), but stream forward pages from a server-side cursor.
+
+  Pages requested with ``before`` come back in reverse index order and
+  have to be flipped, so they are loaded whole as paginate() does.
+  """
+  if before:
+    return paginate(query, keys, after, before, per_page)
+  rows = keyset_query(query, keys, after, before, per_page).execution_options(
+    stream_results=True
+  ).yield_per(batch_size)
+  return StreamedPage(rows, keys, per_page, has_prev=bool(after))
@@ -0,0 +1,218 @@
+"""Monthly range partitions of the Show table.
+
+Show is partitioned by start_time, one partition per calendar month
+("Show_2021_03") plus "Show_default" for shows outside every month that
+has a partition. Queries bounded on start_time, like the upcoming-show
+lookups, are pruned to the partitions of the months they cover.
+
+``flask shows partitions create`` keeps SHOW_PARTITION_MONTHS_AHEAD months
+of partitions ahead of today, moving any rows already in the default
+partition into them. ``flask shows partitions archive`` detaches the
+partitions of months before a cutoff and moves them into the
+SHOW_ARCHIVE_SCHEMA schema (or drops them), taking their shows out of
+the past-show counters.
+"""
+import re
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from models import db, Artist, Venue
+import counters
+
+PARENT = 'Show'
+DEFAULT = 'Show_default'
+
+_BOUNDS = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+shows_cli = AppGroup('shows', help='Maintain the Show table.')
+
+
+def month_start(value):
+  return datetime(value.year, value.month, 1)
+
+
+def add_months(month, count):
+  index = month.year * 12 + month.month - 1 + count
+  return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+  return '{}_{:%Y_%m}'.format(PARENT, month)
+
+
+def partitions():
+  """Return [(name, start, end)] of the monthly partitions, oldest first."""
+  rows = db.session.execute(
+    "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+    "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+    "WHERE i.inhparent = '\"{}\"'::regclass".format(PARENT)
+  ).fetchall()
+  found = []
+  for name, bound in rows:
+    match = _BOUNDS.search(bound)
+    if match:
+      start, end = (datetime.fromisoformat(value) for value in match.groups())
+      found.append((name, start, end))
+  return sorted(found, key=lambda partition: partition[1])
+
+
+def create_partition(month):
+  """Create the partition of month, taking its rows from the default one.
+
+  The table is filled before it is attached, so the default partition
+  never holds rows that belong to an attached month.
+  """
+  name, end = partition_name(month), add_months(month, 1)
+  db.session.execute(
+    'CREATE TABLE "{name}" (LIKE "{parent}" INCLUDING DEFAULTS '
+    'INCLUDING CONSTRAINTS)'.format(name=name, parent=PARENT)
+  )
+  db.session.execute(
+    'WITH moved AS (DELETE FROM "{default}" WHERE start_time >= :start '
+    'AND start_time < :end RETURNING *) '
+    'INSERT INTO "{name}" SELECT * FROM moved'.format(
+      default=DEFAULT, name=name
+    ),
+    {'start': month, 'end': end},
+  )
+  db.session.execute(
+    'ALTER TABLE "{parent}" ATTACH PARTITION "{name}" '
+    "FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')".format(
+      parent=PARENT, name=name, start=month, end=end
+    )
+  )
+  return name
+
+
+def create_ahead(months, today=None):
+  """Create missing partitions up to months ahead of today; return names."""
+  first = month_start(today or datetime.now())
+  existing = {start for _, start, _ in partitions()}
+  created = []
+  for offset in range(months + 1):
+    month = add_months(first, offset)
+    if month not in existing:
+      created.append(create_partition(month))
+  db.session.commit()
+  return created
+
+
+def _uncount_past_shows(name):
+  """Take the shows of partition name out of the past-show counters."""
+  for model, key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+    db.session.execute(
+      'UPDATE "{table}" SET past_shows_count = past_shows_count - archived.n '
+      'FROM (SELECT {key} AS entity_id, count(*) AS n FROM "{name}" '
+      'GROUP BY {key}) AS archived '
+      'WHERE "{table}".id = archived.entity_id'.format(
+        table=model.__tablename__, key=key, name=name
+      )
+    )
+
+
+def _drop_foreign_keys(name):
+  """Drop the foreign keys partition name kept when it was detached.
+
+  Archived shows keep the ids of their venue and artist as plain values,
+  so deleting a venue or artist is not blocked by its archived shows.
+  """
+  constraints = db.session.execute(
+    "SELECT conname FROM pg_constraint "
+    "WHERE conrelid = CAST(:name AS regclass) AND contype = 'f'",
+    {'name': '"{}"'.format(name)},
+  ).fetchall()
+  for constraint, in constraints:
+    db.session.execute('ALTER TABLE "{}" DROP CONSTRAINT "{}"'.format(
+      name, constraint
+    ))
+
+
+def archive_before(cutoff, schema=None, drop=False):
+  """Detach the partitions ending on or before cutoff; return their names.
+
+  cutoff may not be later than the start of the current month, so that
+  every archived show is already counted as past once the counters have
+  rolled over. Archived partitions lose their foreign keys, see
+  _drop_foreign_keys.
+  """
+  if cutoff > month_start(datetime.now()):
+    raise click.BadParameter('cutoff must not be after the current month')
+  counters.roll_over()
+
+  archived = []
+  for name, _, end in partitions():
+    if end > cutoff:
+      break
+    _uncount_past_shows(name)
+    db.session.execute('ALTER TABLE "{}" DETACH PARTITION "{}"'.format(
+      PARENT, name
+    ))
+    if drop:
+      db.session.execute('DROP TABLE "{}"'.format(name))
+    else:
+      _drop_foreign_keys(name)
+      db.session.execute('CREATE SCHEMA IF NOT EXISTS "{}"'.format(schema))
+      db.session.execute('ALTER TABLE "{}" SET SCHEMA "{}"'.format(
+        name, schema
+      ))
+    archived.append(name)
+  db.session.commit()
+  return archived
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@shows_cli.group('partitions')
+def partitions_cli():
+  """Create and archive the monthly partitions of Show."""
+
+
+@partitions_cli.command('list')
+def list_command():
+  """List the monthly partitions and their row estimates."""
+  for name, start, end in partitions():
+    rows = db.session.execute(
+      "SELECT reltuples::bigint FROM pg_class "
+      "WHERE oid = CAST(:name AS regclass)",
+      {'name': '"{}"'.format(name)},
+    ).scalar()
+    click.echo('{:<16} {:%Y-%m-%d} .. {:%Y-%m-%d}  ~{} rows'.format(
+      name, start, end, max(rows, 0)
+    ))
+
+
+@partitions_cli.command('create')
+@click.option('--months', type=int,
+              help='Months ahead of today to cover; defaults to '
+                   'SHOW_PARTITION_MONTHS_AHEAD.')
+def create_command(months):
+  """Create the partitions of the coming months."""
+  if months is None:
+    months = current_app.config['SHOW_PARTITION_MONTHS_AHEAD']
+  created = create_ahead(months)
+  click.echo('Created {} partitions{}'.format(
+    len(created), ': ' + ', '.join(created) if created else '.'
+  ))
+
+
+@partitions_cli.command('archive')
+@click.option('--before', 'cutoff', required=True,
+              type=click.DateTime(formats=['%Y-%m']),
+              help='Archive the months before this one (YYYY-MM).')
+@click.option('--drop', is_flag=True,
+              help='Drop the partitions instead of keeping them in the '
+                   'archive schema.')
+def archive_command(cutoff, drop):
+  """Detach the partitions of past months and archive or drop them."""
+  archived = archive_before(
+    cutoff, current_app.config['SHOW_ARCHIVE_SCHEMA'], drop
+  )
+  click.echo('{} {} partitions{}'.format(
+    'Dropped' if drop else 'Archived', len(archived),
+    ': ' + ', '.join(archived) if archived else '.'
+  ))
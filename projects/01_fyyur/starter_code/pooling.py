@@ -0,0 +1,101 @@
+"""Connection pool telemetry for the primary and replica engines.
+
+InstrumentedQueuePool is a QueuePool that times every checkout, from
+asking for a connection to getting one, and counts checkouts that time
+out. Together with the pool's own size, in-use and overflow figures this
+is served by /admin/pool, to size web workers against the database's
+max_connections: each worker process may hold up to pool_size +
+max_overflow connections per engine.
+"""
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+# Number of most recent checkout waits kept for the percentiles.
+RECENT_WAITS = 1000
+
+
+def _percentile(ordered, fraction):
+  return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class PoolStats(object):
+  """Checkout counters of one pool."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._recent = deque(maxlen=RECENT_WAITS)
+    self.checkouts = 0
+    self.timeouts = 0
+    self.wait_total = 0.0
+    self.wait_max = 0.0
+    self.peak_in_use = 0
+
+  def checked_out(self, wait, in_use):
+    with self._lock:
+      self.checkouts += 1
+      self.wait_total += wait
+      self.wait_max = max(self.wait_max, wait)
+      self.peak_in_use = max(self.peak_in_use, in_use)
+      self._recent.append(wait)
+
+  def timed_out(self, wait):
+    with self._lock:
+      self.timeouts += 1
+      self.wait_max = max(self.wait_max, wait)
+
+  def as_dict(self):
+    with self._lock:
+      recent = sorted(self._recent)
+      stats = {
+        "checkouts": self.checkouts,
+        "timeouts": self.timeouts,
+        "peak_in_use": self.peak_in_use,
+        "avg_wait_ms": (
+          self.wait_total * 1000 / self.checkouts if self.checkouts else None
+        ),
+        "max_wait_ms": self.wait_max * 1000,
+      }
+    for name, fraction in (('p50', .5), ('p95', .95), ('p99', .99)):
+      stats[name + "_wait_ms"] = (
+        _percentile(recent, fraction) * 1000 if recent else None
+      )
+    return stats
+
+
+class InstrumentedQueuePool(QueuePool):
+  """A QueuePool that records checkout waits and timeouts."""
+
+  def __init__(self, creator, pool_size=5, max_overflow=10, timeout=30,
+               **kw):
+    QueuePool.__init__(
+      self, creator, pool_size=pool_size, max_overflow=max_overflow,
+      timeout=timeout, **kw
+    )
+    self.stats = PoolStats()
+
+  def _do_get(self):
+    started = time.perf_counter()
+    try:
+      connection = QueuePool._do_get(self)
+    except exc.TimeoutError:
+      self.stats.timed_out(time.perf_counter() - started)
+      raise
+    self.stats.checked_out(time.perf_counter() - started, self.checkedout())
+    return connection
+
+  def describe(self):
+    """Return the pool's configuration, current usage and checkout stats."""
+    return dict(
+      self.stats.as_dict(),
+      pool_size=self.size(),
+      max_overflow=self._max_overflow,
+      max_connections=self.size() + max(self._max_overflow, 0),
+      timeout=self._timeout,
+      in_use=self.checkedout(),
+      idle=self.checkedin(),
+      overflow=max(self.overflow(), 0),
+    )
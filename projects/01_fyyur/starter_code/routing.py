@@ -0,0 +1,120 @@
+"""Send read-only requests to read replicas and writes to the primary.
+
+Every URI in READ_REPLICA_URIS becomes a Flask-SQLAlchemy bind. GET and
+HEAD requests, and views marked with @replica_reads, pick one replica
+for the whole request; everything else, and any flush, goes to the
+primary bound by SQLALCHEMY_DATABASE_URI. After a request that commits a
+write, a cookie pins the client's reads to the primary for
+READ_YOUR_WRITES_SECONDS, so it sees its own changes even while the
+replicas are catching up. The cookie is a plain timestamp rather than a
+session key, so it holds whichever worker serves the next request; a
+forged one can only send that client's reads to the primary.
+
+Options in POSTGRES_ENGINE_OPTIONS are added to SQLALCHEMY_ENGINE_OPTIONS
+for the engines of postgresql:// URIs only, so binds on other databases,
+such as SQLite files in tests, can still be created.
+"""
+import random
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import event, orm
+
+READ_METHODS = frozenset(['GET', 'HEAD'])
+REPLICA_BIND_PREFIX = 'replica_'
+# Cookie holding the time until which the client reads the primary.
+PRIMARY_UNTIL_COOKIE = 'fyyur_primary_until'
+
+
+def replica_reads(view):
+  """Mark a non-GET view, such as a search form POST, as read-only."""
+  view.replica_reads = True
+  return view
+
+
+@contextmanager
+def primary():
+  """Run the enclosed statements against the primary, even in a read."""
+  if not has_request_context():
+    yield
+    return
+  previous = g.pop('db_replica', None)
+  try:
+    yield
+  finally:
+    if previous is not None:
+      g.db_replica = previous
+
+
+class RoutingSession(SignallingSession):
+  """A session that reads from the request's replica when it has one."""
+
+  def __init__(self, db, **options):
+    self.db = db
+    SignallingSession.__init__(self, db, **options)
+
+  def get_bind(self, mapper=None, clause=None):
+    replica = g.get('db_replica') if has_request_context() else None
+    if replica is not None and not self._flushing:
+      return self.db.get_engine(self.app, bind=replica)
+    return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+  """Flask-SQLAlchemy with replica binds taken from READ_REPLICA_URIS."""
+
+  def init_app(self, app):
+    self.postgres_engine_options = dict(
+      app.config.get('POSTGRES_ENGINE_OPTIONS') or {}
+    )
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for number, uri in enumerate(app.config['READ_REPLICA_URIS']):
+      binds[REPLICA_BIND_PREFIX + str(number)] = uri
+    app.config['SQLALCHEMY_BINDS'] = binds or None
+    super(RoutingSQLAlchemy, self).init_app(app)
+
+    self.replica_binds = sorted(
+      key for key in binds if key.startswith(REPLICA_BIND_PREFIX)
+    )
+    if self.replica_binds:
+      app.before_request(self._route_request)
+      app.after_request(self._remember_write)
+
+  def create_engine(self, sa_url, engine_opts):
+    if sa_url.get_backend_name() == 'postgresql':
+      engine_opts = dict(engine_opts, **self.postgres_engine_options)
+    return super(RoutingSQLAlchemy, self).create_engine(sa_url, engine_opts)
+
+  def create_session(self, options):
+    factory = orm.sessionmaker(class_=RoutingSession, db=self, **options)
+    event.listen(factory, 'after_commit', _note_commit)
+    return factory
+
+  def _route_request(self):
+    view = current_app.view_functions.get(request.endpoint)
+    if request.method not in READ_METHODS and not getattr(
+        view, 'replica_reads', False):
+      return
+    try:
+      primary_until = float(request.cookies.get(PRIMARY_UNTIL_COOKIE, 0))
+    except ValueError:
+      primary_until = 0
+    if primary_until > time.time():
+      return
+    g.db_replica = random.choice(self.replica_binds)
+
+  def _remember_write(self, response):
+    if g.get('db_committed') and request.method not in READ_METHODS:
+      seconds = current_app.config['READ_YOUR_WRITES_SECONDS']
+      response.set_cookie(
+        PRIMARY_UNTIL_COOKIE, '{:.3f}'.format(time.time() + seconds),
+        max_age=seconds, httponly=True, samesite='Lax',
+      )
+    return response
+
+
+def _note_commit(session):
+  if has_request_context():
+    g.db_committed = True
@@ -0,0 +1,168 @@
+"""Date-range queries over a venue's or artist's shows.
+
+Every query here filters on one venue_id or artist_id and a start_time
+range, the shape served by the composite (venue_id, start_time) and
+(artist_id, start_time) indexes on Show, so lookups stay logarithmic in
+the size of the show history.
+"""
+from datetime import datetime
+
+from sqlalchemy import or_, text
+
+from models import db, Artist, Venue, Show
+
+
+def month_range(month):
+  """Return the [start, end) datetimes of a 'YYYY-MM' month."""
+  start = datetime.strptime(month, '%Y-%m')
+  if start.month == 12:
+    return start, start.replace(year=start.year + 1, month=1)
+  return start, start.replace(month=start.month + 1)
+
+
+def _calendar_query(kind):
+  """Return the query and key column for a 'venue' or 'artist' calendar.
+
+  Each show is joined to the other party so its name comes along.
+  """
+  if kind == 'venue':
+    return db.session.query(
+      Show.id,
+      Show.start_time,
+      Show.artist_id,
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link'),
+    ).join(Artist, Show.artist_id == Artist.id), Show.venue_id
+  return db.session.query(
+    Show.id,
+    Show.start_time,
+    Show.venue_id,
+    Venue.name.label('venue_name'),
+    Venue.image_link.label('venue_image_link'),
+  ).join(Venue, Show.venue_id == Venue.id), Show.artist_id
+
+
+def shows_between(kind, entity_id, start, end):
+  """Return the entity's shows starting in [start, end), in time order."""
+  query, key = _calendar_query(kind)
+  return query.filter(
+    key == entity_id,
+    Show.start_time >= start,
+    Show.start_time < end,
+  ).order_by(Show.start_time, Show.id).all()
+
+
+def next_shows(kind, entity_id, after, limit):
+  """Return the entity's first limit shows starting after after."""
+  query, key = _calendar_query(kind)
+  return query.filter(
+    key == entity_id,
+    Show.start_time > after,
+  ).order_by(Show.start_time, Show.id).limit(limit).all()
+
+
+def booking_conflict(venue_id, artist_id, start_time, slot):
+  """Return a show clashing with a new booking, or None.
+
+  A show clashes when it is at the same venue or with the same artist
+  and starts less than slot before or after start_time. The venue and
+  artist rows are locked first, so concurrent bookings for either are
+  checked one after the other; call this inside the transaction that
+  adds the show.
+  """
+  db.session.query(Venue.id).filter(
+    Venue.id == venue_id
+  ).with_for_update().all()
+  db.session.query(Artist.id).filter(
+    Artist.id == artist_id
+  ).with_for_update().all()
+  return Show.query.filter(
+    or_(Show.venue_id == venue_id, Show.artist_id == artist_id),
+    Show.start_time > start_time - slot,
+    Show.start_time < start_time + slot,
+  ).order_by(Show.start_time).first()
+
+
+def lock_parties(venue_ids, artist_ids):
+  """Lock the given venue and artist rows and return the ids that exist.
+
+  Rows are locked in id order so concurrent batches cannot deadlock.
+  """
+  found = []
+  for model, ids in ((Venue, venue_ids), (Artist, artist_ids)):
+    if not ids:
+      found.append(set())
+      continue
+    found.append({
+      entity_id for entity_id, in db.session.query(model.id).filter(
+        model.id.in_(ids)
+      ).order_by(model.id).with_for_update()
+    })
+  return tuple(found)
+
+
+_BATCH_CONFLICTS = text('''
+  SELECT DISTINCT ON (b.idx) b.idx, s.start_time
+  FROM unnest(
+    CAST(:indexes AS integer[]),
+    CAST(:venue_ids AS integer[]),
+    CAST(:artist_ids AS integer[]),
+    CAST(:start_times AS timestamp[])
+  ) AS b(idx, venue_id, artist_id, start_time)
+  JOIN "Show" s
+    ON (s.venue_id = b.venue_id OR s.artist_id = b.artist_id)
+   AND s.start_time > b.start_time - :slot
+   AND s.start_time < b.start_time + :slot
+  ORDER BY b.idx, s.start_time
+''')
+
+
+def _naive_local(value):
+  """Return value as the naive local datetime start_time columns hold."""
+  if value.tzinfo is None:
+    return value
+  return value.astimezone().replace(tzinfo=None)
+
+
+def batch_booking_conflicts(bookings, slot):
+  """Return {index: clashing start_time} for a batch of new bookings.
+
+  bookings maps an index to a (venue_id, artist_id, start_time) triple.
+  Clashes with stored shows are found in one query that probes the
+  composite indexes once per booking; clashes between bookings of the
+  same batch are found in memory, earlier indexes taking precedence.
+  Lock the parties with lock_parties() first.
+  """
+  if not bookings:
+    return {}
+  # Aware and naive start times can't be compared with each other.
+  bookings = {
+    index: (venue_id, artist_id, _naive_local(start_time))
+    for index, (venue_id, artist_id, start_time) in bookings.items()
+  }
+  indexes = sorted(bookings)
+  conflicts = dict(db.session.execute(_BATCH_CONFLICTS, {
+    'indexes': indexes,
+    'venue_ids': [bookings[i][0] for i in indexes],
+    'artist_ids': [bookings[i][1] for i in indexes],
+    'start_times': [bookings[i][2] for i in indexes],
+    'slot': slot,
+  }).fetchall())
+
+  accepted = {}
+  for index in indexes:
+    if index in conflicts:
+      continue
+    venue_id, artist_id, start_time = bookings[index]
+    for party in (('venue', venue_id), ('artist', artist_id)):
+      clash = next((
+        other for other in accepted.get(party, ())
+        if abs(other - start_time) < slot
+      ), None)
+      if clash is not None:
+        conflicts[index] = clash
+        break
+    else:
+      accepted.setdefault(('venue', venue_id), []).append(start_time)
+      accepted.setdefault(('artist', artist_id), []).append(start_time)
+  return conflicts
@@ -1,56 +1,106 @@
-from flask import Flask, abort, jsonify, request
+import io
+import random
+
+from flask import Flask, Response, abort, jsonify, request, stream_with_context
 from flask_cors import CORS
-from models import Category, Question, setup_db
-from sqlalchemy.sql.expression import func
+from models import Question, QuizSession, setup_db
+
+from . import bulk, search
+from .categories import category_cache
 
 QUESTIONS_PER_PAGE = 10
 
 
 def get_questions(request, category_id=None, search_term=None):
-    """Helper to get response for pages returning paginated question data"""
+    """Helper to get response for pages returning paginated question data
+
+    Only the requested page is fetched: ``?page=N`` selects it with
+    LIMIT/OFFSET, while ``?after=<id>`` continues from the last question
+    of the previous page by id, which stays cheap however deep the page.
+    The total comes from a separate COUNT query.
+
+    Search results are ranked by relevance instead, so they are only
+    paged with ``?page``, and carry a highlight of the matched words.
+    Their total counts at most search.MAX_COUNTED_MATCHES matches.
+    """
+    query = Question.query
+    order = [Question.id]
+    tsquery = None
+    current_category = None
     if category_id:
-        questions = Question.query.order_by(Question.id).filter(
-            Question.category == category_id
-        ).all()
-        current_category = Category.query.filter(
-            Category.id == category_id
-        ).first_or_404()
+        current_category = category_cache.get(category_id)
+        if current_category is None:
+            abort(404)
+        query = query.filter(Question.category == category_id)
     elif search_term:
-        questions = Question.query.filter(
-            Question.question.ilike(search_term)
-        ).all()
-        current_category = None
-    else:
-        questions = Question.query.order_by(Question.id).all()
-        current_category = None
-
-    all_categories = Category.query.all()
+        tsquery = search.prefix_query(search_term)
+        if tsquery is None:
+            abort(422)
+        query = query.filter(search.matching(tsquery))
+        order = search.ranking(tsquery)
 
     page = request.args.get("page", 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
+    after = request.args.get("after", type=int)
+    if page < 1 or (after is not None and tsquery is not None):
+        abort(400)
 
-    questions = [question.format() for question in questions]
-    page_questions = questions[start:end]
+    page_query = query.order_by(*order)
+    if after is not None:
+        page_query = page_query.filter(Question.id > after)
+    else:
+        page_query = page_query.offset((page - 1) * QUESTIONS_PER_PAGE)
+    page_questions = [
+        question.format()
+        for question in page_query.limit(QUESTIONS_PER_PAGE).all()
+    ]
+    if tsquery is not None:
+        highlights = search.highlights(
+            [question["id"] for question in page_questions], tsquery
+        )
+        for question in page_questions:
+            question["highlight"] = highlights[question["id"]]
+
+    if tsquery is not None:
+        total_questions = search.count(query)
+    else:
+        total_questions = query.order_by(None).count()
 
     data = {
         "success": True,
         "questions": page_questions,
-        "total_questions": len(questions),
-        "categories": {
-            category.id: category.type for category in all_categories
-        },
-        "current_category":
-            current_category.format() if current_category else None
+        "total_questions": total_questions,
+        "next_cursor":
+            page_questions[-1]["id"]
+            if tsquery is None and len(page_questions) == QUESTIONS_PER_PAGE
+            else None,
+        "categories": category_cache.get_types(),
+        "current_category": current_category
     }
 
     return data
 
 
+def random_question(category_id, previous_questions):
+    """Pick one unplayed question at random without dealing a deck
+
+    Reads the question at a random offset among the candidates, which
+    costs a COUNT instead of sorting them all by random().
+    """
+    query = Question.query.filter(Question.id.notin_(previous_questions))
+    if category_id != 0:
+        query = query.filter(Question.category == category_id)
+    count = query.count()
+    if not count:
+        return None
+    return query.order_by(Question.id).offset(random.randrange(count)).first()
+
+
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
     setup_db(app)
+    category_cache.init_app(app)
+    app.cli.add_command(bulk.questions_cli)
     CORS(app, resources={r"/*": {"origins": "*"}})
 
     # CORS Headers
@@ -97,24 +147,28 @@ def create_app(test_config=None):
     # Routes
     @app.route("/categories")
     def get_categories():
-        categories = Category.query.all()
-
+        # The categories are spliced in already serialised
+        return Response(
+            '{"success": true, "categories": %s}' % category_cache.get_json(),
+            mimetype="application/json"
+        )
+
+    @app.route("/categories/cache")
+    def get_categories_cache_stats():
         return jsonify({
             "success": True,
-            "categories": {
-                category.id: category.type for category in categories
-            }
+            "cache": category_cache.stats()
         })
 
     @app.route("/categories/<int:category_id>")
     def get_category(category_id):
-        category = Category.query.filter(
-            Category.id == category_id
-        ).first_or_404()
+        category = category_cache.get(category_id)
+        if category is None:
+            abort(404)
 
         return jsonify({
             "success": True,
-            "category": category.format()
+            "category": category
         })
 
     @app.route("/categories/<int:category_id>/questions")
@@ -154,6 +208,41 @@ def create_app(test_config=None):
             "success": True
         })
 
+    @app.route("/questions/import", methods=["POST"])
+    def bulk_import_questions():
+        format = request.args.get("format") or (
+            "csv" if request.mimetype == "text/csv" else "ndjson"
+        )
+        if format not in bulk.FORMATS:
+            abort(400)
+        # Read the body as it arrives instead of buffering all of it
+        lines = io.TextIOWrapper(
+            request.stream, encoding="utf-8", errors="replace"
+        )
+        report = bulk.import_questions(lines, format)
+        if "error" in report:
+            # Chunks before the failing line stay imported
+            return jsonify({
+                "success": False,
+                **report
+            }), 500
+
+        return jsonify({
+            "success": True,
+            **report
+        })
+
+    @app.route("/questions/export")
+    def bulk_export_questions():
+        format = request.args.get("format", "ndjson")
+        if format not in bulk.FORMATS:
+            abort(400)
+
+        return Response(
+            stream_with_context(bulk.export_questions(format)),
+            mimetype=bulk.FORMATS[format]
+        )
+
     @app.route("/questions/<int:question_id>", methods=["DELETE"])
     def delete_book(question_id):
         question = Question.query.filter(
@@ -165,9 +254,12 @@ def create_app(test_config=None):
 
     @app.route("/questions/search", methods=["POST"])
     def search_questions():
-        if not request.get_json()["searchTerm"]:
+        search_term = (request.get_json() or {}).get("searchTerm")
+        if isinstance(search_term, (int, float)) and not isinstance(
+                search_term, bool):
+            search_term = str(search_term)
+        if not search_term or not isinstance(search_term, str):
             abort(422)
-        search_term = "%{}%".format(request.get_json()["searchTerm"])
         questions_data = get_questions(request, search_term=search_term)
 
         return jsonify(questions_data)
@@ -175,19 +267,44 @@ def create_app(test_config=None):
     @app.route("/quizzes", methods=["POST"])
     def play_quiz():
         quiz_params = request.get_json()
-        if quiz_params["quiz_category"]["id"] == 0:
-            question = Question.query.order_by(func.random()).filter(
-                Question.id.notin_(quiz_params["previous_questions"])
-            ).first()
-        else:
-            question = Question.query.order_by(func.random()).filter(
-                Question.category == quiz_params["quiz_category"]["id"],
-                Question.id.notin_(quiz_params["previous_questions"])
-            ).first()
+        if "quiz_token" not in quiz_params:
+            # A client that doesn't keep the token would deal a deck per
+            # question; draw a single one instead.
+            question = random_question(
+                quiz_params["quiz_category"]["id"],
+                quiz_params.get("previous_questions", [])
+            )
+            return jsonify({
+                "success": True,
+                "question": question.format() if question else None,
+                "quiz_token": None,
+            })
+
+        token = quiz_params["quiz_token"]
+        if token is not None and not isinstance(token, str):
+            abort(400)
+        drawn = QuizSession.draw(token) if token else None
+        if drawn is None:
+            # First question of a quiz, or its session expired: deal a deck
+            # of the questions that have not been asked yet.
+            token = QuizSession.start(
+                quiz_params["quiz_category"]["id"],
+                quiz_params.get("previous_questions", [])
+            )
+            drawn = QuizSession.draw(token)
+
+        question = None
+        while drawn.question_id is not None:
+            question = Question.query.get(drawn.question_id)
+            if question:
+                break
+            # Deleted since the deck was dealt
+            drawn = QuizSession.draw(token)
 
         return jsonify({
             "success": True,
             "question": question.format() if question else None,
+            "quiz_token": token,
         })
 
     return app
@@ -0,0 +1,253 @@
+import csv
+import io
+import json
+
+import click
+from flask.cli import AppGroup
+from models import Question, db
+from psycopg2 import DataError, Error, IntegrityError
+from sqlalchemy import exc
+
+from .categories import category_cache
+
+# Valid rows written per COPY and transaction.
+CHUNK_SIZE = 5000
+
+# Line errors listed in an import report; the rest are only counted.
+MAX_REPORTED_ERRORS = 100
+
+# What bytes that aren't UTF-8 are decoded to; see read_records().
+REPLACEMENT_CHARACTER = "\ufffd"
+
+FIELDS = ("id", "question", "answer", "category", "difficulty")
+IMPORTED_FIELDS = FIELDS[1:]
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+questions_cli = AppGroup("questions", help="Import and export questions.")
+
+
+class RecordError(ValueError):
+    pass
+
+
+def read_records(lines, format):
+    """Yield (line number, record) for every record of an NDJSON or CSV
+    text stream, or (line number, RecordError) for one that can't be read
+
+    Decode the stream with errors="replace": records holding replaced
+    bytes are reported as invalid UTF-8 instead of ending the import.
+    """
+    if format == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            if any(isinstance(value, str) and REPLACEMENT_CHARACTER in value
+                   for value in record.values()):
+                record = RecordError("invalid UTF-8")
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        if REPLACEMENT_CHARACTER in line:
+            yield line_number, RecordError("invalid UTF-8")
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, RecordError("invalid JSON: {}".format(e))
+            continue
+        if not isinstance(record, dict):
+            record = RecordError("expected a JSON object")
+        yield line_number, record
+
+
+def _integer(record, field):
+    value = record.get(field)
+    # int() would accept True and truncate 2.7
+    if isinstance(value, bool) or (
+            isinstance(value, float) and not value.is_integer()):
+        raise RecordError("{} must be an integer".format(field))
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RecordError("{} must be an integer".format(field))
+
+
+def clean(record, categories):
+    """Return the column values of a question record or raise RecordError
+    """
+    row = {}
+    for field in ("question", "answer"):
+        value = record.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise RecordError("{} is required".format(field))
+        if "\x00" in value:
+            raise RecordError("{} contains a NUL character".format(field))
+        row[field] = value.strip()
+    category = _integer(record, "category")
+    difficulty = _integer(record, "difficulty")
+    if category not in categories:
+        raise RecordError("category {} does not exist".format(category))
+    if not 1 <= difficulty <= 5:
+        raise RecordError("difficulty must be between 1 and 5")
+    row["category"] = str(category)
+    row["difficulty"] = difficulty
+    return row
+
+
+def _database_error(error):
+    """First line of the message of a psycopg2 error, raw or wrapped"""
+    return str(getattr(error, "orig", error)).strip().splitlines()[0]
+
+
+def _copy(rows):
+    """Write rows with COPY in the session's transaction and commit"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[field] for field in IMPORTED_FIELDS])
+    buffer.seek(0)
+    with db.session.connection().connection.cursor() as cursor:
+        cursor.copy_expert(
+            "COPY questions ({}) FROM STDIN WITH (FORMAT csv)".format(
+                ", ".join(IMPORTED_FIELDS)
+            ),
+            buffer
+        )
+    db.session.commit()
+
+
+def _add_error(report, line_number, message):
+    report["failed"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append({"line": line_number, "error": message})
+
+
+def _write_chunk(chunk, report):
+    """Import a chunk of (line number, row) pairs and update the report
+
+    If the database rejects a row of the chunk, the chunk is inserted
+    again row by row in savepoints, so only the rows it rejects fail.
+    """
+    try:
+        _copy([row for _, row in chunk])
+        report["imported"] += len(chunk)
+        return
+    except (DataError, IntegrityError, exc.DataError, exc.IntegrityError):
+        db.session.rollback()
+
+    for line_number, row in chunk:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(Question.__table__.insert(), row)
+        except (exc.DataError, exc.IntegrityError) as e:
+            _add_error(report, line_number, _database_error(e))
+        else:
+            report["imported"] += 1
+    db.session.commit()
+
+
+def import_questions(lines, format="ndjson", chunk_size=CHUNK_SIZE):
+    """Import the questions of a text stream, one chunk at a time
+
+    Invalid records are skipped and reported with their line number; the
+    valid ones are committed every chunk_size rows, so an import stopped
+    halfway keeps the chunks written so far. When the database fails
+    altogether, the report returned so far gets an "error" naming the
+    first line that was not imported. Nothing but the current chunk is
+    held in memory.
+    """
+    categories = category_cache.get_types()
+    report = {"imported": 0, "failed": 0, "errors": []}
+    chunk = []
+    try:
+        for line_number, record in read_records(lines, format):
+            try:
+                if isinstance(record, RecordError):
+                    raise record
+                chunk.append((line_number, clean(record, categories)))
+            except RecordError as e:
+                _add_error(report, line_number, str(e))
+                continue
+            if len(chunk) == chunk_size:
+                _write_chunk(chunk, report)
+                chunk = []
+        if chunk:
+            _write_chunk(chunk, report)
+    except (Error, exc.DBAPIError) as e:
+        db.session.rollback()
+        report["error"] = {
+            "line": chunk[0][0],
+            "error": _database_error(e)
+        }
+    return report
+
+
+def export_questions(format="ndjson", batch_size=CHUNK_SIZE):
+    """Yield every question, in id order, as NDJSON or CSV lines
+
+    Rows are read from a server-side cursor batch_size at a time.
+    """
+    rows = db.session.query(
+        *[getattr(Question, field) for field in FIELDS]
+    ).order_by(Question.id).execution_options(
+        stream_results=True
+    ).yield_per(batch_size)
+
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(FIELDS)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() > 65536:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+        return
+    for row in rows:
+        yield json.dumps(dict(zip(FIELDS, row))) + "\n"
+
+
+def _format_of(path, format):
+    if format:
+        return format
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+@questions_cli.command("import")
+@click.argument("source", type=click.File("r", encoding="utf-8",
+                                          errors="replace"))
+@click.option("--format", type=click.Choice(sorted(FORMATS)),
+              help="Defaults to csv for .csv files, ndjson otherwise.")
+@click.option("--chunk-size", default=CHUNK_SIZE, show_default=True)
+def import_command(source, format, chunk_size):
+    """Import questions from an NDJSON or CSV file ("-" for stdin)."""
+    report = import_questions(
+        source, _format_of(source.name, format), chunk_size
+    )
+    for error in report["errors"]:
+        click.echo("line {line}: {error}".format(**error), err=True)
+    click.echo("Imported {} questions, {} failed.".format(
+        report["imported"], report["failed"]
+    ))
+    if "error" in report:
+        raise click.ClickException(
+            "stopped at line {line}: {error}".format(**report["error"])
+        )
+
+
+@questions_cli.command("export")
+@click.argument("target", type=click.File("w", encoding="utf-8"),
+                default="-")
+@click.option("--format", type=click.Choice(sorted(FORMATS)),
+              help="Defaults to csv for .csv files, ndjson otherwise.")
+def export_command(target, format):
+    """Export every question as NDJSON or CSV (to stdout by default)."""
+    for chunk in export_questions(_format_of(target.name, format)):
+        target.write(chunk)
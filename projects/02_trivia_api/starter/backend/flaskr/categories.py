@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+
+from models import Category, ReferenceVersion, db
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert
+
+# How long a worker trusts its copy before checking the version again.
+REVALIDATE_SECONDS = 5
+
+VERSION_NAME = "categories"
+
+
+class CategoryCache:
+    """In-process copy of the categories, shared by every request of a worker
+
+    Holds the id -> type map and the same map serialised to JSON, together
+    with the version they were loaded at. Every Category write bumps the
+    version row in the database, so workers only have to compare version
+    numbers, at most every REVALIDATE_SECONDS, to know their copy is stale.
+    """
+
+    def __init__(self, revalidate_seconds=REVALIDATE_SECONDS):
+        self.revalidate_seconds = revalidate_seconds
+        self.version = None
+        self.types = {}
+        self.json = "{}"
+        self.checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        for name in ("after_insert", "after_update", "after_delete"):
+            if not event.contains(Category, name, self._bump_version):
+                event.listen(Category, name, self._bump_version)
+
+    def _bump_version(self, mapper, connection, target):
+        connection.execute(
+            insert(ReferenceVersion.__table__).values(
+                name=VERSION_NAME, version=1
+            ).on_conflict_do_update(
+                index_elements=["name"],
+                set_={"version": ReferenceVersion.__table__.c.version + 1}
+            )
+        )
+        self.expire()
+
+    def expire(self):
+        """Make the next read check the version"""
+        self.checked_at = 0.0
+
+    def _current_version(self):
+        return db.session.query(ReferenceVersion.version).filter(
+            ReferenceVersion.name == VERSION_NAME
+        ).scalar() or 0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self.checked_at < self.revalidate_seconds:
+            self.hits += 1
+            return
+        with self._lock:
+            if now - self.checked_at < self.revalidate_seconds:
+                self.hits += 1
+                return
+            self.revalidations += 1
+            # Read the version first: a write landing in between only
+            # causes one more reload.
+            version = self._current_version()
+            if version == self.version:
+                self.hits += 1
+            else:
+                self.misses += 1
+                types = {
+                    category.id: category.type
+                    for category in Category.query.order_by(Category.id)
+                }
+                self.types, self.json, self.version = (
+                    types, json.dumps(types), version
+                )
+            self.checked_at = time.monotonic()
+
+    def get_types(self):
+        """Return a copy of the id -> type map of every category"""
+        self._refresh()
+        return dict(self.types)
+
+    def get_json(self):
+        """Return the id -> type map as a JSON object"""
+        self._refresh()
+        return self.json
+
+    def get(self, category_id):
+        """Return the formatted category with that id, or None"""
+        self._refresh()
+        category_type = self.types.get(category_id)
+        if category_type is None:
+            return None
+        return {"id": category_id, "type": category_type}
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "categories": len(self.types),
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+        }
+
+
+category_cache = CategoryCache()
@@ -0,0 +1,81 @@
+import re
+
+from models import SEARCH_CONFIG, Question, db
+from sqlalchemy import func, literal_column
+
+WORD = re.compile(r"[^\W_]+")
+
+# Stored tsvector of a question's question and answer text; see models.py.
+DOCUMENT = literal_column("questions.search_document")
+
+# Matches counted for the total of a search; more are reported as this many.
+MAX_COUNTED_MATCHES = 1000
+
+# Tags wrapped around the matched words in the highlights.
+HIGHLIGHT_OPTIONS = "StartSel=<mark>, StopSel=</mark>, HighlightAll=TRUE"
+
+# Replaced in the text before it is highlighted, ampersand first.
+HTML_ENTITIES = [
+    ("&", "&amp;"),
+    ("<", "&lt;"),
+    (">", "&gt;"),
+    ('"', "&quot;"),
+    ("'", "&#39;"),
+]
+
+
+def prefix_query(search_term):
+    """Return a tsquery matching questions containing words starting with
+    every word of the search term, or None if it has no words"""
+    words = WORD.findall(search_term.lower())
+    if not words:
+        return None
+    return func.to_tsquery(
+        literal_column(SEARCH_CONFIG),
+        " & ".join("{}:*".format(word) for word in words)
+    )
+
+
+def matching(tsquery):
+    return DOCUMENT.op("@@")(tsquery)
+
+
+def ranking(tsquery):
+    """Order by relevance, best first, then by id"""
+    return [func.ts_rank(DOCUMENT, tsquery).desc(), Question.id]
+
+
+def count(query):
+    """Count the rows of a search query, up to MAX_COUNTED_MATCHES"""
+    return query.order_by(None).with_entities(Question.id).limit(
+        MAX_COUNTED_MATCHES
+    ).count()
+
+
+def _escaped(text):
+    for character, entity in HTML_ENTITIES:
+        text = func.replace(text, character, entity)
+    return text
+
+
+def highlights(question_ids, tsquery):
+    """Return {id: {"question": ..., "answer": ...}} with the matches marked
+
+    The text is HTML-escaped before it is highlighted, so the <mark> tags
+    are the only markup in it. ts_headline doesn't match words inside the
+    entities.
+    """
+    if not question_ids:
+        return {}
+    config = literal_column(SEARCH_CONFIG)
+    rows = db.session.query(
+        Question.id,
+        func.ts_headline(config, _escaped(Question.question), tsquery,
+                         HIGHLIGHT_OPTIONS),
+        func.ts_headline(config, _escaped(Question.answer), tsquery,
+                         HIGHLIGHT_OPTIONS)
+    ).filter(Question.id.in_(question_ids))
+    return {
+        question_id: {"question": question, "answer": answer}
+        for question_id, question, answer in rows
+    }
@@ -1,5 +1,10 @@
+import random
+import secrets
+from datetime import datetime, timedelta
+
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, DateTime, Integer, String
+from sqlalchemy.dialects.postgresql import ARRAY
 
 database_name = "trivia"
 database_path = "postgresql://postgres:postgres@{}/{}".format(
@@ -7,6 +12,28 @@ database_path = "postgresql://postgres:postgres@{}/{}".format(
     database_name
 )
 
+# How long an idle quiz keeps its deck before it can be evicted.
+QUIZ_SESSION_TTL = timedelta(minutes=30)
+
+# Text search configuration of the question search. 'simple' only lowercases
+# words, so prefix queries match the words as they were written.
+SEARCH_CONFIG = "'simple'::regconfig"
+
+# Searches match and rank questions.search_document, a tsvector of the
+# question and answer text that Postgres stores with each row, through a GIN
+# index. The generated column is left out of Question: create_all would add
+# it as a plain column that nothing fills in.
+QUESTION_SEARCH_DDL = [
+    "ALTER TABLE questions ADD COLUMN IF NOT EXISTS search_document tsvector "
+    "GENERATED ALWAYS AS (to_tsvector({}, "
+    "coalesce(question, '') || ' ' || coalesce(answer, ''))) STORED".format(
+        SEARCH_CONFIG
+    ),
+    "DROP INDEX IF EXISTS ix_questions_search",
+    "CREATE INDEX IF NOT EXISTS ix_questions_search_document ON questions "
+    "USING gin (search_document)",
+]
+
 db = SQLAlchemy()
 
 
@@ -17,6 +44,9 @@ def setup_db(app, database_path=database_path):
     db.app = app
     db.init_app(app)
     db.create_all()
+    with db.engine.begin() as connection:
+        for statement in QUESTION_SEARCH_DDL:
+            connection.execute(statement)
 
 
 class Question(db.Model):
@@ -64,8 +94,95 @@ class Category(db.Model):
     def __init__(self, type):
         self.type = type
 
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+
+    def update(self):
+        db.session.commit()
+
+    def delete(self):
+        db.session.delete(self)
+        db.session.commit()
+
     def format(self):
         return {
             'id': self.id,
             'type': self.type
         }
+
+
+class ReferenceVersion(db.Model):
+    """Version of a reference table, bumped on every write to it"""
+    __tablename__ = 'reference_versions'
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class QuizSession(db.Model):
+    """Shuffled deck of question ids a quiz draws one question at a time from
+    """
+    __tablename__ = 'quiz_sessions'
+
+    token = Column(String(32), primary_key=True)
+    deck = Column(ARRAY(Integer), nullable=False)
+    position = Column(Integer, nullable=False, default=0)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    @classmethod
+    def start(cls, category_id, previous_questions):
+        """Deal a new deck and return its token
+
+        The deck holds the ids of the category's questions (every question
+        for category 0) minus previous_questions, in random order. Expired
+        sessions are evicted on the way.
+        """
+        now = datetime.utcnow()
+        cls.query.filter(cls.expires_at <= now).delete(
+            synchronize_session=False
+        )
+
+        query = db.session.query(Question.id).filter(
+            Question.id.notin_(previous_questions)
+        )
+        if category_id != 0:
+            query = query.filter(Question.category == category_id)
+        deck = [question_id for question_id, in query]
+        random.shuffle(deck)
+
+        session = cls(
+            token=secrets.token_hex(16),
+            deck=deck,
+            position=0,
+            expires_at=now + QUIZ_SESSION_TTL
+        )
+        db.session.add(session)
+        db.session.commit()
+        return session.token
+
+    @classmethod
+    def draw(cls, token):
+        """Pop the next question id off a session's deck
+
+        Returns None if there is no unexpired session with that token,
+        otherwise a row whose question_id is the next id, or None once the
+        deck is used up. Drawing keeps the session alive for another TTL.
+        """
+        now = datetime.utcnow()
+        table = cls.__table__
+        # RETURNING sees the incremented position, and arrays are 1-based.
+        row = db.session.execute(
+            table.update().where(
+                table.c.token == token
+            ).where(
+                table.c.expires_at > now
+            ).values(
+                position=table.c.position + 1,
+                expires_at=now + QUIZ_SESSION_TTL
+            ).returning(
+                table.c.deck[table.c.position].label("question_id")
+            )
+        ).first()
+        db.session.commit()
+        return row
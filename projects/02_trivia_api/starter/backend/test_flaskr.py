@@ -4,7 +4,8 @@ import unittest
 from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
-from models import setup_db
+from flaskr.categories import category_cache
+from models import Category, Question, QuizSession, db, setup_db
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -39,6 +40,42 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], True)
         self.assertTrue(len(data["categories"]))
 
+    def test_categories_cache_stats(self):
+        self.client().get("/categories")
+        before = json.loads(self.client().get("/categories/cache").data)
+        self.client().get("/categories")
+        res = self.client().get("/categories/cache")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertGreater(data["cache"]["hits"], before["cache"]["hits"])
+        self.assertEqual(data["cache"]["misses"], before["cache"]["misses"])
+
+    def test_category_types_are_copied(self):
+        with self.app.app_context():
+            category_cache.get_types()[1] = "Changed"
+            self.assertNotEqual(category_cache.get_types()[1], "Changed")
+
+    def test_category_write_bumps_version(self):
+        self.client().get("/categories")
+        before = json.loads(self.client().get("/categories/cache").data)
+        with self.app.app_context():
+            category = Category(type="Music")
+            category.insert()
+            category_id = category.id
+        data = json.loads(self.client().get("/categories").data)
+        self.assertEqual(data["categories"][str(category_id)], "Music")
+
+        with self.app.app_context():
+            Category.query.get(category_id).delete()
+        data = json.loads(self.client().get("/categories").data)
+        self.assertNotIn(str(category_id), data["categories"])
+        stats = json.loads(self.client().get("/categories/cache").data)
+        self.assertGreater(
+            stats["cache"]["version"], before["cache"]["version"]
+        )
+
     def test_method_not_allowed_categories(self):
         res = self.client().post("/categories")
         data = json.loads(res.data)
@@ -73,6 +110,25 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], False)
         self.assertEqual(res.status_code, 404)
 
+    def test_get_paginated_questions_after_cursor(self):
+        first = json.loads(self.client().get("/questions").data)
+        second = json.loads(self.client().get("/questions?page=2").data)
+        res = self.client().get(
+            "/questions?after={}".format(first["next_cursor"])
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["questions"], second["questions"])
+        self.assertEqual(data["total_questions"], first["total_questions"])
+
+    def test_get_paginated_questions_page_zero(self):
+        res = self.client().get("/questions?page=0")
+        data = json.loads(res.data)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(res.status_code, 400)
+
     def test_get_paginated_questions_category(self):
         res = self.client().get("/categories/1/questions")
         data = json.loads(res.data)
@@ -156,12 +212,162 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["total_questions"], 8)
         self.assertEqual(data["current_category"], None)
 
+    def test_search_questions_answer_prefix(self):
+        res = self.client().post(
+            "/questions/search",
+            json={"searchTerm": "scissor"}
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["total_questions"], 1)
+        self.assertEqual(data["questions"][0]["id"], 6)
+        self.assertEqual(
+            data["questions"][0]["highlight"]["answer"],
+            "Edward <mark>Scissorhands</mark>"
+        )
+
+    def test_search_questions_with_cursor(self):
+        res = self.client().post(
+            "/questions/search?after=10",
+            json={"searchTerm": "What"}
+        )
+        data = json.loads(res.data)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(res.status_code, 400)
+
     def test_search_questions_empty_search(self):
         res = self.client().post("/questions/search", json={"searchTerm": ""})
         data = json.loads(res.data)
         self.assertEqual(data["success"], False)
         self.assertEqual(res.status_code, 422)
 
+    def test_search_questions_escapes_highlights(self):
+        self.addCleanup(self.delete_bulk_questions)
+        with self.app.app_context():
+            Question("Bulk <b>bold</b> & amp?", "Yes", "1", 1).insert()
+        res = self.client().post(
+            "/questions/search",
+            json={"searchTerm": "bold amp"}
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["total_questions"], 1)
+        self.assertEqual(
+            data["questions"][0]["highlight"]["question"],
+            "Bulk &lt;b&gt;<mark>bold</mark>&lt;/b&gt; &amp; <mark>amp</mark>?"
+        )
+
+    def test_search_questions_numeric_term(self):
+        res = self.client().post("/questions/search", json={"searchTerm": 5})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+
+    def test_search_questions_invalid_term(self):
+        res = self.client().post(
+            "/questions/search",
+            json={"searchTerm": ["What"]}
+        )
+        data = json.loads(res.data)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(res.status_code, 422)
+
+    def delete_bulk_questions(self):
+        with self.app.app_context():
+            Question.query.filter(Question.question.like("Bulk %")).delete(
+                synchronize_session=False
+            )
+            db.session.commit()
+
+    def test_import_questions_ndjson(self):
+        self.addCleanup(self.delete_bulk_questions)
+        res = self.client().post(
+            "/questions/import",
+            data="\n".join([
+                json.dumps({"question": "Bulk one?", "answer": "Yes",
+                            "category": 1, "difficulty": 1}),
+                json.dumps({"question": "Bulk two?", "answer": "",
+                            "category": 1, "difficulty": 1}),
+                json.dumps({"question": "Bulk three?", "answer": "Yes",
+                            "category": 2, "difficulty": 3}),
+            ]),
+            content_type="application/x-ndjson"
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["imported"], 2)
+        self.assertEqual(data["failed"], 1)
+        self.assertEqual(data["errors"][0]["line"], 2)
+
+    def test_import_questions_csv(self):
+        self.addCleanup(self.delete_bulk_questions)
+        res = self.client().post(
+            "/questions/import",
+            data="question,answer,category,difficulty\n"
+                 "\"Bulk, from CSV?\",Yes,3,2\n"
+                 "Bulk bad category?,No,50,2\n",
+            content_type="text/csv"
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["imported"], 1)
+        self.assertEqual(data["errors"], [
+            {"line": 3, "error": "category 50 does not exist"}
+        ])
+
+    def test_import_questions_invalid_values(self):
+        self.addCleanup(self.delete_bulk_questions)
+        res = self.client().post(
+            "/questions/import",
+            data=b"\n".join([
+                json.dumps({"question": "Bulk bool?", "answer": "Yes",
+                            "category": True, "difficulty": 1}).encode(),
+                json.dumps({"question": "Bulk float?", "answer": "Yes",
+                            "category": 1, "difficulty": 2.7}).encode(),
+                b'{"question": "Bulk \xff?", "answer": "Yes", '
+                b'"category": 1, "difficulty": 1}',
+                json.dumps({"question": "Bulk fine?", "answer": "Yes",
+                            "category": 5, "difficulty": 2.0}).encode(),
+            ]),
+            content_type="application/x-ndjson"
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["imported"], 1)
+        self.assertEqual(data["errors"], [
+            {"line": 1, "error": "category must be an integer"},
+            {"line": 2, "error": "difficulty must be an integer"},
+            {"line": 3, "error": "invalid UTF-8"},
+        ])
+
+    def test_import_questions_unknown_format(self):
+        res = self.client().post("/questions/import?format=xml", data="")
+        data = json.loads(res.data)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(res.status_code, 400)
+
+    def test_export_questions(self):
+        total = json.loads(self.client().get("/questions").data)[
+            "total_questions"
+        ]
+        res = self.client().get("/questions/export")
+        lines = res.data.decode().splitlines()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, "application/x-ndjson")
+        self.assertEqual(len(lines), total)
+        self.assertEqual(
+            set(json.loads(lines[0])),
+            {"id", "question", "answer", "category", "difficulty"}
+        )
+
     def test_play_quiz_all(self):
         res = self.client().post("/quizzes", json={
             "previous_questions": [],
@@ -184,6 +390,69 @@ class TriviaTestCase(unittest.TestCase):
         self.assertNotIn(data["question"]["id"], [20, 21])
         self.assertEqual(data["question"]["category"], 1)
 
+    def test_play_quiz_without_token(self):
+        with self.app.app_context():
+            sessions = QuizSession.query.count()
+        res = self.client().post("/quizzes", json={
+            "previous_questions": [20, 21],
+            "quiz_category": {"type": "Science", "id": 1}
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["quiz_token"], None)
+        self.assertEqual(data["question"]["category"], 1)
+        with self.app.app_context():
+            self.assertEqual(QuizSession.query.count(), sessions)
+
+    def test_play_quiz_with_token(self):
+        quiz_category = {"type": "Science", "id": 1}
+        res = self.client().post("/quizzes", json={
+            "previous_questions": [],
+            "quiz_category": quiz_category,
+            "quiz_token": None
+        })
+        data = json.loads(res.data)
+        token = data["quiz_token"]
+        played = []
+        while data["question"]:
+            self.assertEqual(data["quiz_token"], token)
+            self.assertEqual(data["question"]["category"], 1)
+            played.append(data["question"]["id"])
+            data = json.loads(self.client().post("/quizzes", json={
+                "previous_questions": played,
+                "quiz_category": quiz_category,
+                "quiz_token": token
+            }).data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(played), 3)
+        self.assertEqual(len(set(played)), 3)
+
+    def test_play_quiz_unknown_token(self):
+        res = self.client().post("/quizzes", json={
+            "previous_questions": [20, 21],
+            "quiz_category": {"type": "Science", "id": 1},
+            "quiz_token": "unknown"
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertNotEqual(data["quiz_token"], "unknown")
+        self.assertNotIn(data["question"]["id"], [20, 21])
+
+    def test_play_quiz_invalid_token(self):
+        res = self.client().post("/quizzes", json={
+            "previous_questions": [],
+            "quiz_category": {"type": "Science", "id": 1},
+            "quiz_token": 12
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data["success"], False)
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
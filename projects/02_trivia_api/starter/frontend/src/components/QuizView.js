@@ -10,6 +10,7 @@ class QuizView extends Component {
     super();
     this.state = {
         quizCategory: null,
+        quizToken: null,
         previousQuestions: [], 
         showAnswer: false,
         categories: {},
@@ -54,7 +55,8 @@ class QuizView extends Component {
       contentType: 'application/json',
       data: JSON.stringify({
         previous_questions: previousQuestions,
-        quiz_category: this.state.quizCategory
+        quiz_category: this.state.quizCategory,
+        quiz_token: this.state.quizToken
       }),
       xhrFields: {
         withCredentials: true
@@ -63,6 +65,7 @@ class QuizView extends Component {
       success: (result) => {
         this.setState({
           showAnswer: false,
+          quizToken: result.quiz_token,
           previousQuestions: previousQuestions,
           currentQuestion: result.question,
           guess: '',
@@ -90,6 +93,7 @@ class QuizView extends Component {
   restartGame = () => {
     this.setState({
       quizCategory: null,
+      quizToken: null,
       previousQuestions: [], 
       showAnswer: false,
       numCorrect: 0,